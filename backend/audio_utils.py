@@ -2,15 +2,38 @@
 Audio utility functions for voice processing
 Handles format conversion, validation, and preprocessing
 """
+from __future__ import annotations
 import io
 import os
+import json
 import logging
-from typing import Optional, Tuple
-from pydub import AudioSegment
-import numpy as np
+import subprocess
+import tempfile
+import wave
+from typing import Optional, Tuple, Union
+
+from startup_report import lazy_import
+from logging_setup import sampled
+
+np = lazy_import("numpy")
+pydub = lazy_import("pydub")
+vad = lazy_import("faster_whisper.vad", "faster_whisper")
 
 logger = logging.getLogger(__name__)
 
+# Speech pre-filter counters exposed on /metrics
+speech_filter_stats = {
+    "checks": 0,
+    "too_quiet": 0,
+    "no_voiced_frames": 0,
+    "no_speech_detected": 0
+}
+
+
+def get_speech_filter_stats() -> dict:
+    """Get speech pre-filter counters"""
+    return dict(speech_filter_stats)
+
 
 class AudioUtils:
     """Utility functions for audio processing"""
@@ -24,6 +47,35 @@ class AudioUtils:
     # Max audio length (5 minutes)
     MAX_DURATION_SECONDS = 300
     
+    # Max upload size in bytes (5 minutes of 16-bit 48kHz stereo WAV fits)
+    MAX_UPLOAD_BYTES = int(os.getenv("MAX_AUDIO_UPLOAD_BYTES", str(64 * 1024 * 1024)))
+    
+    # Chunk size when streaming uploads to disk
+    UPLOAD_CHUNK_SIZE = 64 * 1024
+    
+    # Clips with less speech than this skip Whisper (0 disables the check)
+    MIN_SPEECH_SECONDS = float(os.getenv("MIN_SPEECH_SECONDS", "0.25"))
+    
+    # Speech pre-filter: frames quieter than this are never speech
+    SPEECH_MIN_DBFS = -50.0
+    
+    # Zero-crossing rate (per sample) above which a frame is noise-like;
+    # broadband noise is around 0.5, whispered speech stays below
+    SPEECH_MAX_ZCR = 0.4
+    
+    # Silero VAD only looks at windows around voiced frames, at most this
+    # much audio per clip; it stops at the first window with speech
+    SPEECH_VAD_BUDGET_SECONDS = 30.0
+    
+    # VAD runs on windows of at most this length
+    SPEECH_VAD_WINDOW_SECONDS = 5.0
+    
+    # Voiced frames closer than this belong to the same VAD window
+    SPEECH_VAD_MERGE_GAP_SECONDS = 1.0
+    
+    # Context added on both sides of a VAD window
+    SPEECH_VAD_PAD_SECONDS = 0.5
+    
     @staticmethod
     def convert_to_wav(
         audio_data: bytes,
@@ -41,7 +93,7 @@ class AudioUtils:
         """
         try:
             # Load audio
-            audio = AudioSegment.from_file(
+            audio = pydub.AudioSegment.from_file(
                 io.BytesIO(audio_data),
                 format=input_format
             )
@@ -63,7 +115,7 @@ class AudioUtils:
             )
             
             wav_data = wav_buffer.getvalue()
-            logger.info(f"Converted {input_format} to WAV: {len(wav_data)} bytes")
+            logger.info("Converted %s to WAV: %d bytes", input_format, len(wav_data), extra=sampled())
             
             return wav_data
             
@@ -88,7 +140,7 @@ class AudioUtils:
         """
         try:
             # Try to load audio
-            audio = AudioSegment.from_file(io.BytesIO(audio_data))
+            audio = pydub.AudioSegment.from_file(io.BytesIO(audio_data))
             
             # Check duration
             duration_seconds = len(audio) / 1000.0
@@ -109,6 +161,185 @@ class AudioUtils:
         except Exception as e:
             return False, f"Invalid audio format: {str(e)}"
     
+    @staticmethod
+    async def spool_upload(
+        upload,
+        max_bytes: Optional[int] = None,
+        hasher=None
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """
+        Stream an uploaded file to a temporary file on disk
+        
+        The upload is copied in small chunks so memory usage stays flat
+        regardless of the file size, and copying stops as soon as the
+        size limit is exceeded.
+        
+        Args:
+            upload: FastAPI UploadFile
+            max_bytes: Maximum allowed size in bytes
+            hasher: hashlib object updated with every chunk (optional),
+                    so the upload can be fingerprinted without re-reading
+        
+        Returns:
+            Tuple of (temp_file_path, error_message). The caller must
+            delete the file when done.
+        """
+        limit = max_bytes or AudioUtils.MAX_UPLOAD_BYTES
+        suffix = os.path.splitext(upload.filename or "")[1]
+        
+        tmp = tempfile.NamedTemporaryFile(prefix="lentera-audio-", suffix=suffix, delete=False)
+        total = 0
+        too_large = False
+        try:
+            with tmp:
+                while True:
+                    chunk = await upload.read(AudioUtils.UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    total += len(chunk)
+                    if total > limit:
+                        too_large = True
+                        break
+                    tmp.write(chunk)
+                    if hasher is not None:
+                        hasher.update(chunk)
+        except Exception:
+            os.unlink(tmp.name)
+            raise
+        
+        if too_large:
+            os.unlink(tmp.name)
+            return None, f"Audio file too large: more than {limit} bytes"
+        
+        return tmp.name, None
+    
+    @staticmethod
+    def probe_audio(file_path: str) -> dict:
+        """
+        Read container/stream metadata with ffprobe without decoding
+        
+        Args:
+            file_path: Path to audio file
+        
+        Returns:
+            Dictionary with audio info (empty if probing failed)
+        """
+        try:
+            result = subprocess.run(
+                [
+                    "ffprobe", "-v", "error",
+                    "-print_format", "json",
+                    "-show_format", "-show_streams",
+                    "-select_streams", "a:0",
+                    file_path
+                ],
+                capture_output=True,
+                check=True
+            )
+            probe = json.loads(result.stdout)
+        except Exception as e:
+            logger.error(f"Failed to probe audio: {e}")
+            return {}
+        
+        streams = probe.get("streams") or [{}]
+        stream = streams[0]
+        fmt = probe.get("format", {})
+        
+        # Some containers (e.g. MediaRecorder webm) do not store a duration
+        duration = stream.get("duration") or fmt.get("duration")
+        try:
+            duration_seconds = float(duration)
+        except (TypeError, ValueError):
+            duration_seconds = None
+        
+        return {
+            "duration_seconds": duration_seconds,
+            "channels": stream.get("channels"),
+            "sample_rate": int(stream.get("sample_rate", 0)) or None,
+            "sample_width": (stream.get("bits_per_sample") or 0) // 8 or None,
+            "format": fmt.get("format_name", "unknown"),
+            "size_bytes": int(fmt.get("size", 0)) or None
+        }
+    
+    @staticmethod
+    def load_pcm(
+        source: Union[str, bytes],
+        sample_rate: Optional[int] = None,
+        max_duration: Optional[float] = None
+    ) -> np.ndarray:
+        """
+        Decode audio to mono float32 PCM in a single ffmpeg pass
+        
+        Args:
+            source: Path to audio file or encoded audio bytes
+            sample_rate: Output sample rate (default: TARGET_SAMPLE_RATE)
+            max_duration: Stop decoding after this many seconds
+        
+        Returns:
+            Float32 numpy array in the range [-1, 1]
+        """
+        sr = sample_rate or AudioUtils.TARGET_SAMPLE_RATE
+        from_file = isinstance(source, str)
+        
+        cmd = ["ffmpeg", "-nostdin", "-v", "error", "-i", source if from_file else "pipe:0"]
+        if max_duration:
+            cmd += ["-t", str(max_duration)]
+        cmd += ["-f", "s16le", "-ac", "1", "-acodec", "pcm_s16le", "-ar", str(sr), "pipe:1"]
+        
+        try:
+            result = subprocess.run(
+                cmd,
+                input=None if from_file else source,
+                capture_output=True,
+                check=True
+            )
+        except subprocess.CalledProcessError as e:
+            raise ValueError(f"Failed to decode audio: {e.stderr.decode(errors='ignore').strip()}")
+        
+        samples = np.frombuffer(result.stdout, dtype=np.int16).astype(np.float32)
+        samples /= 32768.0
+        return samples
+    
+    @staticmethod
+    def validate_samples(
+        samples: np.ndarray,
+        sample_rate: Optional[int] = None,
+        max_duration: Optional[int] = None
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Validate decoded PCM samples
+        
+        Args:
+            samples: Mono float32 samples
+            sample_rate: Sample rate of the samples
+            max_duration: Maximum duration in seconds
+        
+        Returns:
+            Tuple of (is_valid, error_message)
+        """
+        sr = sample_rate or AudioUtils.TARGET_SAMPLE_RATE
+        duration_seconds = len(samples) / sr
+        max_dur = max_duration or AudioUtils.MAX_DURATION_SECONDS
+        
+        if duration_seconds > max_dur:
+            return False, f"Audio too long: {duration_seconds:.1f}s > {max_dur}s"
+        
+        if duration_seconds < 0.1:
+            return False, "Audio too short: must be at least 0.1 seconds"
+        
+        if not np.any(samples):
+            return False, "Audio is silent"
+        
+        return True, None
+    
+    @staticmethod
+    def samples_dBFS(samples: np.ndarray) -> float:
+        """RMS level of float samples in dBFS (-inf for digital silence)"""
+        if len(samples) == 0:
+            return float('-inf')
+        rms = float(np.sqrt(np.mean(np.square(samples, dtype=np.float64))))
+        return 20 * np.log10(rms) if rms > 0 else float('-inf')
+    
     @staticmethod
     def get_audio_info(audio_data: bytes) -> dict:
         """
@@ -121,7 +352,7 @@ class AudioUtils:
             Dictionary with audio info
         """
         try:
-            audio = AudioSegment.from_file(io.BytesIO(audio_data))
+            audio = pydub.AudioSegment.from_file(io.BytesIO(audio_data))
             
             return {
                 "duration_seconds": len(audio) / 1000.0,
@@ -137,76 +368,289 @@ class AudioUtils:
             return {}
     
     @staticmethod
-    def trim_silence(
-        audio_data: bytes,
+    def frame_rms_db(
+        samples: np.ndarray,
+        sample_rate: Optional[int] = None,
+        frame_ms: int = 10
+    ) -> np.ndarray:
+        """
+        Compute per-frame RMS level in dBFS in one vectorized pass
+        
+        Args:
+            samples: Float samples, shape (n,) or (n, channels)
+            sample_rate: Sample rate of the samples
+            frame_ms: Frame size in milliseconds
+        
+        Returns:
+            Array with one dBFS value per frame (last partial frame included)
+        """
+        sr = sample_rate or AudioUtils.TARGET_SAMPLE_RATE
+        frame_len = max(1, int(sr * frame_ms / 1000))
+        
+        # Mix down to mono for level detection only
+        mono = samples.mean(axis=1) if samples.ndim > 1 else samples
+        
+        n_full = len(mono) // frame_len
+        power = np.square(mono[:n_full * frame_len], dtype=np.float64)
+        mean_power = power.reshape(n_full, frame_len).mean(axis=1)
+        
+        if len(mono) % frame_len:
+            tail = np.square(mono[n_full * frame_len:], dtype=np.float64).mean()
+            mean_power = np.append(mean_power, tail)
+        
+        # Floor avoids log10(0) for digital silence
+        return 10 * np.log10(np.maximum(mean_power, 1e-20))
+    
+    @staticmethod
+    def trailing_silence_seconds(
+        samples: np.ndarray,
+        sample_rate: Optional[int] = None,
         silence_threshold: int = -40,
         chunk_size: int = 10
-    ) -> bytes:
+    ) -> float:
+        """
+        Length of the silence at the end of the audio
+        
+        Args:
+            samples: Float samples, shape (n,) or (n, channels)
+            sample_rate: Sample rate of the samples
+            silence_threshold: Silence threshold in dBFS
+            chunk_size: Chunk size in milliseconds
+        
+        Returns:
+            Trailing silence in seconds (whole clip if it is all silence)
+        """
+        levels = AudioUtils.frame_rms_db(samples, sample_rate, chunk_size)
+        loud_frames = np.flatnonzero(levels > silence_threshold)
+        silent_frames = len(levels) - (loud_frames[-1] + 1 if len(loud_frames) else 0)
+        return silent_frames * chunk_size / 1000.0
+    
+    @staticmethod
+    def detect_speech(
+        samples: np.ndarray,
+        sample_rate: Optional[int] = None,
+        min_speech_seconds: Optional[float] = None,
+        frame_ms: int = 30
+    ) -> Tuple[bool, Optional[str]]:
+        """
+        Cheap speech-presence check before full Whisper decoding
+        
+        Cheapest stages first: overall level, then per-frame energy and
+        zero-crossing rate (taps and hiss have too few voiced frames), then
+        Silero VAD on windows around the voiced frames of the clips that are
+        left, stopping at the first window with speech.
+        
+        Args:
+            samples: Mono float32 samples
+            sample_rate: Sample rate of the samples
+            min_speech_seconds: Required speech (default: MIN_SPEECH_SECONDS)
+            frame_ms: Frame size in milliseconds
+        
+        Returns:
+            Tuple of (has_speech, reason); reason is "too_quiet",
+            "no_voiced_frames" or "no_speech_detected" when there is none
+        """
+        sr = sample_rate or AudioUtils.TARGET_SAMPLE_RATE
+        min_speech = AudioUtils.MIN_SPEECH_SECONDS if min_speech_seconds is None else min_speech_seconds
+        if min_speech <= 0:
+            return True, None
+        
+        has_speech, reason = AudioUtils._detect_speech(samples, sr, min_speech, frame_ms)
+        speech_filter_stats["checks"] += 1
+        if reason:
+            speech_filter_stats[reason] += 1
+        return has_speech, reason
+    
+    @staticmethod
+    def _detect_speech(
+        samples: np.ndarray,
+        sr: int,
+        min_speech: float,
+        frame_ms: int
+    ) -> Tuple[bool, Optional[str]]:
+        frame_len = max(1, int(sr * frame_ms / 1000))
+        n_frames = len(samples) // frame_len
+        if n_frames == 0:
+            return False, "no_voiced_frames"
+        
+        frames = samples[:n_frames * frame_len].reshape(n_frames, frame_len)
+        energy_db = 10 * np.log10(np.maximum(np.square(frames, dtype=np.float64).mean(axis=1), 1e-20))
+        if energy_db.max() < AudioUtils.SPEECH_MIN_DBFS:
+            return False, "too_quiet"
+        
+        signs = np.signbit(frames)
+        zcr = (signs[:, 1:] != signs[:, :-1]).mean(axis=1)
+        voiced = (energy_db > AudioUtils.SPEECH_MIN_DBFS) & (zcr < AudioUtils.SPEECH_MAX_ZCR)
+        if voiced.sum() * frame_ms / 1000 < min_speech:
+            return False, "no_voiced_frames"
+        
+        # Silero VAD (bundled with faster-whisper) only works at 16kHz
+        if sr != 16000:
+            return True, None
+        
+        # Runs of voiced frames, most voiced first
+        voiced_frames = np.flatnonzero(voiced)
+        max_gap = max(1, int(AudioUtils.SPEECH_VAD_MERGE_GAP_SECONDS * 1000 / frame_ms))
+        runs = np.split(voiced_frames, np.flatnonzero(np.diff(voiced_frames) > max_gap) + 1)
+        runs.sort(key=len, reverse=True)
+        
+        pad = int(AudioUtils.SPEECH_VAD_PAD_SECONDS * sr)
+        window = int(AudioUtils.SPEECH_VAD_WINDOW_SECONDS * sr)
+        budget = int(AudioUtils.SPEECH_VAD_BUDGET_SECONDS * sr)
+        try:
+            options = vad.VadOptions(
+                min_speech_duration_ms=int(min_speech * 1000),
+                speech_pad_ms=0
+            )
+            for run in runs:
+                run_start = max(0, run[0] * frame_len - pad)
+                run_end = min(len(samples), (run[-1] + 1) * frame_len + pad)
+                for start in range(run_start, run_end, window):
+                    if budget <= 0:
+                        # Budget spent without a verdict: let Whisper decide
+                        return True, None
+                    end = min(run_end, start + window, start + budget)
+                    budget -= end - start
+                    if vad.get_speech_timestamps(samples[start:end], options):
+                        return True, None
+        except ImportError:
+            return True, None
+        
+        return False, "no_speech_detected"
+    
+    @staticmethod
+    def _decode_for_processing(audio_data: bytes) -> Tuple[np.ndarray, int]:
+        """Decode audio bytes to float32 samples of shape (n, channels)"""
+        # 16-bit PCM WAV is read directly, skipping the ffmpeg round trip
+        if audio_data[:4] == b"RIFF":
+            try:
+                with wave.open(io.BytesIO(audio_data), "rb") as wav:
+                    if wav.getsampwidth() == 2:
+                        frames = wav.readframes(wav.getnframes())
+                        samples = np.frombuffer(frames, dtype='<i2').astype(np.float32)
+                        samples /= 32768.0
+                        return samples.reshape(-1, wav.getnchannels()), wav.getframerate()
+            except wave.Error:
+                pass
+        
+        audio = pydub.AudioSegment.from_file(io.BytesIO(audio_data))
+        scale = float(1 << (8 * audio.sample_width - 1))
+        samples = np.array(audio.get_array_of_samples(), dtype=np.float32)
+        samples /= scale
+        return samples.reshape(-1, audio.channels), audio.frame_rate
+    
+    @staticmethod
+    def _encode_wav(samples: np.ndarray, sample_rate: int) -> bytes:
+        """Encode float samples of shape (n,) or (n, channels) as 16-bit WAV"""
+        channels = samples.shape[1] if samples.ndim > 1 else 1
+        pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2')
+        
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(channels)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(pcm.tobytes())
+        
+        return buffer.getvalue()
+    
+    @staticmethod
+    def trim_silence(
+        audio_data: Union[bytes, np.ndarray],
+        silence_threshold: int = -40,
+        chunk_size: int = 10,
+        sample_rate: Optional[int] = None,
+        padding_ms: int = 200
+    ) -> Union[bytes, np.ndarray]:
         """
         Trim silence from beginning and end of audio
         
+        Only leading and trailing silence is removed; pauses inside speech
+        are kept. Some audio is kept around the loud part so soft onsets and
+        quiet word endings (fricatives, final syllables) are not clipped.
+        
         Args:
-            audio_data: Input audio bytes
+            audio_data: Input audio bytes, or decoded float samples
             silence_threshold: Silence threshold in dBFS
             chunk_size: Chunk size in milliseconds
+            sample_rate: Sample rate when audio_data is an array
+            padding_ms: Audio kept before the first and after the last loud frame
         
         Returns:
-            Trimmed audio bytes
+            Trimmed WAV bytes for bytes input, or a view of the input array
         """
         try:
-            audio = AudioSegment.from_file(io.BytesIO(audio_data))
+            if isinstance(audio_data, np.ndarray):
+                samples, sr = audio_data, sample_rate or AudioUtils.TARGET_SAMPLE_RATE
+            else:
+                samples, sr = AudioUtils._decode_for_processing(audio_data)
             
-            # Detect non-silent chunks
-            non_silent_chunks = [
-                chunk for chunk in audio[::chunk_size]
-                if chunk.dBFS > silence_threshold
-            ]
+            # Find first and last non-silent frames
+            levels = AudioUtils.frame_rms_db(samples, sr, chunk_size)
+            loud_frames = np.flatnonzero(levels > silence_threshold)
             
-            if not non_silent_chunks:
+            if len(loud_frames) == 0:
                 logger.warning("Audio is all silence after trimming")
                 return audio_data
             
-            # Trim
-            trimmed = AudioSegment.silent(duration=0)
-            for chunk in non_silent_chunks:
-                trimmed += chunk
+            frame_len = max(1, int(sr * chunk_size / 1000))
+            padding = int(sr * padding_ms / 1000)
+            start = max(0, loud_frames[0] * frame_len - padding)
+            end = min((loud_frames[-1] + 1) * frame_len + padding, len(samples))
+            trimmed = samples[start:end]
             
-            # Export
-            buffer = io.BytesIO()
-            trimmed.export(buffer, format="wav")
+            if isinstance(audio_data, np.ndarray):
+                return trimmed
             
-            return buffer.getvalue()
+            return AudioUtils._encode_wav(trimmed, sr)
             
         except Exception as e:
             logger.error(f"Failed to trim silence: {e}")
             return audio_data
     
     @staticmethod
-    def normalize_volume(audio_data: bytes, target_dBFS: float = -20.0) -> bytes:
+    def normalize_volume(
+        audio_data: Union[bytes, np.ndarray],
+        target_dBFS: float = -20.0,
+        sample_rate: Optional[int] = None
+    ) -> Union[bytes, np.ndarray]:
         """
         Normalize audio volume
         
+        Float arrays are scaled in place; integer arrays are converted to
+        float32 first.
+        
         Args:
-            audio_data: Input audio bytes
+            audio_data: Input audio bytes, or decoded float samples
             target_dBFS: Target volume in dBFS
+            sample_rate: Sample rate when audio_data is an array (unused,
+                         kept for symmetry with trim_silence)
         
         Returns:
-            Normalized audio bytes
+            Normalized WAV bytes for bytes input, or the scaled array
         """
         try:
-            audio = AudioSegment.from_file(io.BytesIO(audio_data))
+            if isinstance(audio_data, np.ndarray):
+                samples = audio_data
+                if not np.issubdtype(samples.dtype, np.floating):
+                    samples = samples.astype(np.float32)
+                sr = sample_rate or AudioUtils.TARGET_SAMPLE_RATE
+            else:
+                samples, sr = AudioUtils._decode_for_processing(audio_data)
             
-            # Calculate gain needed
-            change_in_dBFS = target_dBFS - audio.dBFS
+            current_dBFS = AudioUtils.samples_dBFS(samples)
+            if current_dBFS == float('-inf'):
+                return audio_data
             
-            # Apply gain
-            normalized = audio.apply_gain(change_in_dBFS)
+            # Apply gain in place and clip to avoid wrap-around
+            gain = 10 ** ((target_dBFS - current_dBFS) / 20)
+            samples *= gain
+            np.clip(samples, -1.0, 1.0, out=samples)
             
-            # Export
-            buffer = io.BytesIO()
-            normalized.export(buffer, format="wav")
+            if isinstance(audio_data, np.ndarray):
+                return samples
             
-            return buffer.getvalue()
+            return AudioUtils._encode_wav(samples, sr)
             
         except Exception as e:
             logger.error(f"Failed to normalize volume: {e}")
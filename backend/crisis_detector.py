@@ -0,0 +1,248 @@
+"""
+Crisis phrase fast path
+Detects self-harm and suicide signals in chat text and transcripts with a
+precompiled Aho-Corasick automaton, so a safety response with hotline
+information can be sent before (and regardless of) the LLM reply
+"""
+import re
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from tts_service import TTSService
+
+logger = logging.getLogger(__name__)
+
+# Phrases are matched on whole words after normalize_text()
+CRISIS_PHRASES = {
+    "id": [
+        "bunuh diri", "ingin mati", "pengen mati", "pingin mati", "mau mati saja",
+        "mengakhiri hidup", "akhiri hidupku", "lebih baik mati", "lebih baik aku mati",
+        "tidak ingin hidup lagi", "tidak mau hidup lagi", "gak mau hidup lagi",
+        "nggak mau hidup lagi", "ga mau hidup lagi", "capek hidup", "lelah hidup",
+        "menyakiti diri", "melukai diri", "menyayat tangan", "sayat tangan",
+        "gantung diri", "minum racun", "loncat dari gedung", "lompat dari gedung",
+        "overdosis obat", "tidak ada alasan untuk hidup"
+    ],
+    "en": [
+        "suicide", "suicidal", "kill myself", "end my life", "take my own life",
+        "want to die", "wanna die", "better off dead", "no reason to live",
+        "don't want to live", "dont want to live", "do not want to live", "hurt myself", "cut myself", "self harm",
+        "overdose on"
+    ]
+}
+
+SAFETY_MESSAGE = (
+    "Aku mendengarmu, dan keselamatanmu sangat penting. Kamu tidak sendirian. "
+    "Jika kamu dalam bahaya atau berpikir untuk menyakiti diri sendiri, segera hubungi "
+    "layanan darurat 112, atau layanan kesehatan jiwa Kementerian Kesehatan di 119 "
+    "ekstensi 8. Hubungi juga orang yang kamu percaya sekarang. Aku tetap di sini "
+    "untuk mendengarkanmu."
+)
+
+NON_WORD = re.compile(r"[^\w]+")
+
+# Explicit denials: a crisis match lying inside one of these is not counted
+# ("saya tidak ingin mati"). Kept deliberately short; a missed crisis is far
+# worse than an extra hotline message
+SAFE_PHRASES = [
+    "tidak ingin mati", "tak ingin mati", "gak ingin mati", "nggak ingin mati",
+    "ga ingin mati", "tidak mau mati", "gak mau mati", "nggak mau mati",
+    "not suicidal", "don't want to die", "do not want to die"
+]
+
+# ...unless the denial is questioned or an instruction: "kenapa tidak ingin
+# mati", "why not", "jangan ..."
+QUESTIONING_WORDS = ["kenapa", "mengapa", "jangan", "why"]
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase, punctuation to spaces, padded so matches fall on word boundaries"""
+    return f" {NON_WORD.sub(' ', text.lower()).strip()} "
+
+
+class AhoCorasick:
+    """Multi-pattern matcher: one pass over the text finds every pattern"""
+    
+    def __init__(self, patterns: List[str]):
+        self.patterns = patterns
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        
+        for index, pattern in enumerate(patterns):
+            node = 0
+            for char in pattern:
+                next_node = self._goto[node].get(char)
+                if next_node is None:
+                    next_node = len(self._goto)
+                    self._goto[node][char] = next_node
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                node = next_node
+            self._output[node].append(index)
+        
+        # Breadth-first failure links
+        queue = deque([0])
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                queue.append(child)
+                fallback = self._fail[node]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0) if node else 0
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+    
+    def finditer(self, text: str) -> Iterator[Tuple[int, int]]:
+        """
+        Find every occurrence of every pattern
+        
+        Returns:
+            Iterator of (pattern index, start offset in text)
+        """
+        goto, fail, output, patterns = self._goto, self._fail, self._output, self.patterns
+        node = 0
+        
+        for end, char in enumerate(text, 1):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            for index in output[node]:
+                yield index, end - len(patterns[index])
+    
+    def search(self, text: str) -> List[str]:
+        """
+        Find patterns occurring in text
+        
+        Returns:
+            Matched patterns, each at most once, in order of first match
+        """
+        found = dict.fromkeys(index for index, _ in self.finditer(text))
+        return [self.patterns[index] for index in found]
+
+
+class CrisisDetector:
+    """
+    Flags crisis phrases and serves a cached spoken safety response
+    """
+    
+    def __init__(self, phrases: Optional[Dict[str, List[str]]] = None):
+        """
+        Initialize crisis detector
+        
+        Args:
+            phrases: Phrases per language (default: CRISIS_PHRASES)
+        """
+        phrases = phrases or CRISIS_PHRASES
+        
+        # Normalized pattern -> phrase as written, for reporting
+        self._phrases = {normalize_text(p): p for group in phrases.values() for p in group}
+        self._safe = {normalize_text(p) for p in SAFE_PHRASES} - set(self._phrases)
+        self._matcher = AhoCorasick(sorted(set(self._phrases) | self._safe))
+        self._questioning = tuple(f" {word}" for word in QUESTIONING_WORDS)
+        
+        # Safety audio per output format, synthesized once
+        self._audio: Dict[str, bytes] = {}
+        self._audio_locks: Dict[str, asyncio.Lock] = {}
+        
+        self.stats = {
+            "checks": 0,
+            "detections": 0,
+            "negated": 0
+        }
+        
+        logger.info(f"CrisisDetector configured: {len(self._phrases)} phrases")
+    
+    def detect(self, text: str) -> List[str]:
+        """
+        Find crisis phrases in text
+        
+        Args:
+            text: Chat message or transcript
+        
+        Returns:
+            Matched phrases (empty if none)
+        """
+        self.stats["checks"] += 1
+        if not text:
+            return []
+        
+        normalized = normalize_text(text)
+        denials: List[Tuple[int, int]] = []
+        hits: List[Tuple[str, int, int]] = []
+        for index, start in self._matcher.finditer(normalized):
+            pattern = self._matcher.patterns[index]
+            end = start + len(pattern)
+            if pattern not in self._safe:
+                hits.append((pattern, start, end))
+            # Patterns start with the padding space, so the text before
+            # them ends at the previous word
+            elif not normalized[:start].endswith(self._questioning):
+                denials.append((start, end))
+        
+        found: Dict[str, None] = {}
+        negated = False
+        for pattern, start, end in hits:
+            if any(d_start <= start and end <= d_end for d_start, d_end in denials):
+                negated = True
+            else:
+                found[pattern] = None
+        
+        matches = [self._phrases[match] for match in found]
+        if matches:
+            self.stats["detections"] += 1
+        elif negated:
+            self.stats["negated"] += 1
+        return matches
+    
+    async def safety_audio(self, tts_service: TTSService, output_format: str) -> Optional[bytes]:
+        """
+        Spoken SAFETY_MESSAGE in the given format, synthesized once
+        
+        Returns:
+            Audio bytes, or None if synthesis failed (send text only)
+        """
+        audio = self._audio.get(output_format)
+        if audio is not None:
+            return audio
+        
+        lock = self._audio_locks.setdefault(output_format, asyncio.Lock())
+        async with lock:
+            if output_format not in self._audio:
+                try:
+                    self._audio[output_format] = await tts_service.synthesize(SAFETY_MESSAGE, output_format)
+                except Exception as e:
+                    logger.error(f"Safety response synthesis failed: {e}")
+                    return None
+        
+        return self._audio[output_format]
+    
+    async def warm_up(self, tts_service: TTSService):
+        """Synthesize the safety response in the default format ahead of time"""
+        if await self.safety_audio(tts_service, tts_service.default_output_format) is not None:
+            logger.info("Safety response audio cached")
+    
+    def get_stats(self) -> dict:
+        """Get detector counters"""
+        return {
+            "phrases": len(self._phrases),
+            "cached_formats": sorted(self._audio),
+            **self.stats
+        }
+
+
+# Global instance (singleton)
+crisis_detector: Optional[CrisisDetector] = None
+
+
+def get_crisis_detector() -> CrisisDetector:
+    """Get or create crisis detector instance"""
+    global crisis_detector
+    
+    if crisis_detector is None:
+        crisis_detector = CrisisDetector()
+    
+    return crisis_detector
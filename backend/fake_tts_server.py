@@ -0,0 +1,39 @@
+"""
+Fake TTS server for local testing of the TTS engine
+Returns the requested text as "audio" after a delay proportional to its length
+
+Run:
+    uvicorn fake_tts_server:app --port 8100
+    TTS_BACKEND_URL=http://localhost:8100/synthesize python main.py
+"""
+import os
+import random
+import asyncio
+from typing import Optional
+from fastapi import FastAPI
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+# Simulated synthesis time per character
+DELAY_PER_CHAR_MS = float(os.getenv("FAKE_TTS_DELAY_PER_CHAR_MS", "10"))
+
+# Fraction of sessions that stall (to exercise timeouts and hedging)
+SLOW_SESSION_RATE = float(os.getenv("FAKE_TTS_SLOW_SESSION_RATE", "0"))
+SLOW_SESSION_SECONDS = float(os.getenv("FAKE_TTS_SLOW_SESSION_SECONDS", "30"))
+
+app = FastAPI(title="Fake TTS Server")
+
+
+class SynthesizeRequest(BaseModel):
+    text: str
+    voice: Optional[str] = None
+
+
+@app.post("/synthesize")
+async def synthesize(request: SynthesizeRequest):
+    delay = len(request.text) * DELAY_PER_CHAR_MS / 1000
+    if random.random() < SLOW_SESSION_RATE:
+        delay = SLOW_SESSION_SECONDS
+    
+    await asyncio.sleep(delay)
+    return Response(content=f"[{request.text}]".encode("utf-8"), media_type="audio/mpeg")
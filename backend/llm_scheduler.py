@@ -0,0 +1,335 @@
+"""
+Fair-share scheduler for LLM requests
+Sits in front of OllamaService so a few heavy users cannot starve the rest:
+per-user queues, start-time fair queueing across users, per-user token
+bucket rate limits and priority for voice turns over chat and batch work
+"""
+import os
+import time
+import heapq
+import asyncio
+import logging
+from itertools import count
+from typing import Dict, List, Optional
+
+from ollama_service import OllamaService
+
+logger = logging.getLogger(__name__)
+
+# Priority classes, lower runs first
+PRIORITY_VOICE = 0
+PRIORITY_CHAT = 1
+PRIORITY_BATCH = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_VOICE: "voice",
+    PRIORITY_CHAT: "chat",
+    PRIORITY_BATCH: "batch"
+}
+
+# Requests without a user_id share one flow under this key, with its own
+# service-wide rate and queue limits and a larger fair-share weight
+ANONYMOUS_USER = "anonymous"
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a user is over their request rate or queue limit"""
+    
+    def __init__(self, user_id: str, retry_after: float):
+        super().__init__(f"Rate limit exceeded for user {user_id}")
+        self.user_id = user_id
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to burst"""
+    
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+    
+    def take(self, amount: float = 1.0) -> float:
+        """
+        Take tokens if available
+        
+        Returns:
+            0 on success, otherwise seconds until enough tokens are available
+        """
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        
+        if self.tokens >= amount:
+            self.tokens -= amount
+            return 0.0
+        
+        return (amount - self.tokens) / self.rate if self.rate > 0 else float("inf")
+    
+    @property
+    def is_full(self) -> bool:
+        elapsed = time.monotonic() - self.updated_at
+        return self.tokens + elapsed * self.rate >= self.burst
+
+
+class _Ticket:
+    """A queued request waiting for an Ollama slot"""
+    
+    __slots__ = ("user_id", "priority", "future", "enqueued_at")
+    
+    def __init__(self, user_id: str, priority: int):
+        self.user_id = user_id
+        self.priority = priority
+        self.future = asyncio.get_running_loop().create_future()
+        self.enqueued_at = time.monotonic()
+
+
+class LLMScheduler:
+    """
+    Admits LLM requests to Ollama a few at a time, fairly across users
+    
+    Each request gets a start tag max(virtual_time, user's last finish tag)
+    and a finish tag start + cost / weight. Waiting requests run by
+    (priority, start tag), so a user with a long backlog only gets their
+    weighted share while others are waiting.
+    """
+    
+    def __init__(
+        self,
+        ollama_service: OllamaService,
+        max_concurrent: int = 2,
+        user_rate_per_minute: float = 20.0,
+        user_burst: int = 5,
+        max_queued_per_user: int = 8,
+        anonymous_rate_per_minute: float = 120.0,
+        anonymous_burst: int = 20,
+        max_queued_anonymous: int = 32,
+        anonymous_weight: float = 4.0
+    ):
+        """
+        Initialize scheduler
+        
+        Args:
+            ollama_service: LLM service requests are forwarded to
+            max_concurrent: Requests sent to Ollama at once
+            user_rate_per_minute: Sustained requests per user (0 disables)
+            user_burst: Requests a user may send at once before rate limiting
+            max_queued_per_user: Waiting requests allowed per user
+            anonymous_rate_per_minute: Sustained requests without a user_id,
+                                       all clients together (0 disables)
+            anonymous_burst: Burst for requests without a user_id
+            max_queued_anonymous: Waiting requests without a user_id
+            anonymous_weight: Fair share of the anonymous flow, in users
+        """
+        self.ollama_service = ollama_service
+        self.max_concurrent = max_concurrent
+        self.user_rate_per_minute = user_rate_per_minute
+        self.user_burst = user_burst
+        self.max_queued_per_user = max_queued_per_user
+        self.anonymous_rate_per_minute = anonymous_rate_per_minute
+        self.anonymous_burst = anonymous_burst
+        self.max_queued_anonymous = max_queued_anonymous
+        self.anonymous_weight = anonymous_weight
+        
+        self._queue: List[tuple] = []
+        self._sequence = count()
+        self._running = 0
+        self._virtual_time = 0.0
+        self._finish_tags: Dict[str, float] = {}
+        self._queued_per_user: Dict[str, int] = {}
+        self._buckets: Dict[str, TokenBucket] = {}
+        
+        self.stats = {
+            "dispatched": 0,
+            "rate_limited": 0,
+            "queue_full": 0,
+            "cancelled": 0
+        }
+        self._wait_totals = {name: [0, 0.0] for name in PRIORITY_NAMES.values()}
+        
+        logger.info(
+            f"LLMScheduler configured: max_concurrent={max_concurrent}, "
+            f"user_rate={user_rate_per_minute}/min, burst={user_burst}"
+        )
+    
+    @staticmethod
+    def estimate_cost(messages: List[Dict[str, str]]) -> float:
+        """Rough request cost in units of ~1000 prompt characters (min 1)"""
+        chars = sum(len(message.get("content", "")) for message in messages)
+        return max(1.0, chars / 1000)
+    
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        user_id: Optional[str] = None,
+        priority: int = PRIORITY_CHAT,
+        weight: float = 1.0,
+        stream: bool = False
+    ) -> Dict:
+        """
+        Chat with Ollama once a fair-share slot is free
+        
+        Args:
+            messages: List of message dicts with 'role' and 'content'
+            user_id: Requesting user (optional; anonymous requests share
+                     one flow and the anonymous limits)
+            priority: PRIORITY_VOICE, PRIORITY_CHAT or PRIORITY_BATCH
+            weight: User's share relative to others (default 1)
+            stream: Whether to stream the response
+        
+        Returns:
+            Chat response (same shape as OllamaService.chat)
+        
+        Raises:
+            RateLimitExceeded: User is over their rate or queue limit
+        """
+        if not user_id:
+            user_id = ANONYMOUS_USER
+            weight *= self.anonymous_weight
+        self._admit(user_id)
+        
+        ticket = self._enqueue(user_id, priority, self.estimate_cost(messages) / max(weight, 1e-6))
+        try:
+            await ticket.future
+        except asyncio.CancelledError:
+            # Slot was granted just before we were cancelled: hand it back
+            if not ticket.future.cancelled():
+                self._release()
+            self.stats["cancelled"] += 1
+            raise
+        finally:
+            self._queued_per_user[user_id] -= 1
+            if not self._queued_per_user[user_id]:
+                del self._queued_per_user[user_id]
+        
+        try:
+            return await self.ollama_service.chat(messages, stream=stream)
+        finally:
+            self._release()
+    
+    def _admit(self, user_id: str):
+        """Apply the user's queue limit and token bucket"""
+        if user_id == ANONYMOUS_USER:
+            rate, burst, max_queued = self.anonymous_rate_per_minute, self.anonymous_burst, self.max_queued_anonymous
+        else:
+            rate, burst, max_queued = self.user_rate_per_minute, self.user_burst, self.max_queued_per_user
+        
+        if self._queued_per_user.get(user_id, 0) >= max_queued:
+            self.stats["queue_full"] += 1
+            raise RateLimitExceeded(user_id, retry_after=1.0)
+        
+        if rate <= 0:
+            return
+        
+        bucket = self._buckets.get(user_id)
+        if bucket is None:
+            self._purge_idle_buckets()
+            bucket = TokenBucket(rate / 60, burst)
+            self._buckets[user_id] = bucket
+        
+        retry_after = bucket.take()
+        if retry_after:
+            self.stats["rate_limited"] += 1
+            raise RateLimitExceeded(user_id, retry_after=retry_after)
+    
+    def _enqueue(self, user_id: str, priority: int, cost: float) -> _Ticket:
+        """Tag a request and queue it, dispatching if a slot is free"""
+        start = max(self._virtual_time, self._finish_tags.get(user_id, 0.0))
+        self._finish_tags[user_id] = start + cost
+        
+        ticket = _Ticket(user_id, priority)
+        self._queued_per_user[user_id] = self._queued_per_user.get(user_id, 0) + 1
+        heapq.heappush(self._queue, (priority, start, next(self._sequence), ticket))
+        self._dispatch()
+        return ticket
+    
+    def _dispatch(self):
+        """Grant free slots to the best waiting requests"""
+        while self._running < self.max_concurrent and self._queue:
+            _, start, _, ticket = heapq.heappop(self._queue)
+            if ticket.future.done():
+                # Caller was cancelled while waiting
+                continue
+            
+            self._virtual_time = max(self._virtual_time, start)
+            self._running += 1
+            self.stats["dispatched"] += 1
+            
+            totals = self._wait_totals[PRIORITY_NAMES[ticket.priority]]
+            totals[0] += 1
+            totals[1] += time.monotonic() - ticket.enqueued_at
+            
+            ticket.future.set_result(None)
+        
+        if not self._queue and not self._running:
+            # Idle: tags from past work no longer matter
+            self._finish_tags.clear()
+            self._virtual_time = 0.0
+    
+    def _release(self):
+        self._running -= 1
+        self._dispatch()
+    
+    def _purge_idle_buckets(self):
+        """Forget users whose bucket has refilled completely"""
+        if len(self._buckets) < 1024:
+            return
+        for user_id in [u for u, bucket in self._buckets.items() if bucket.is_full]:
+            del self._buckets[user_id]
+    
+    def get_stats(self) -> dict:
+        """Get scheduler state and counters"""
+        return {
+            "max_concurrent": self.max_concurrent,
+            "running": self._running,
+            "queued": sum(self._queued_per_user.values()),
+            "queued_users": len(self._queued_per_user),
+            "avg_wait_ms": {
+                name: round(total / n * 1000, 1) if n else 0.0
+                for name, (n, total) in self._wait_totals.items()
+            },
+            **self.stats
+        }
+
+
+# Global instance (singleton)
+llm_scheduler: Optional[LLMScheduler] = None
+
+
+def get_llm_scheduler(ollama_service: Optional[OllamaService] = None) -> LLMScheduler:
+    """Get or create LLM scheduler instance"""
+    global llm_scheduler
+    
+    if llm_scheduler is None:
+        max_concurrent = int(os.getenv("LLM_MAX_CONCURRENT", "2"))
+        
+        # Every uvicorn worker has its own scheduler: share the Ollama slots
+        workers = max(1, int(os.getenv("API_WORKERS", "1")))
+        if max_concurrent < workers:
+            logger.warning(
+                f"LLM_MAX_CONCURRENT={max_concurrent} < API_WORKERS={workers}: every worker still "
+                f"sends 1 request at a time, up to {workers} at once in total"
+            )
+        max_concurrent = max(1, max_concurrent // workers)
+        user_rate_per_minute = float(os.getenv("LLM_USER_RATE_PER_MINUTE", "20"))
+        user_burst = int(os.getenv("LLM_USER_BURST", "5"))
+        max_queued_per_user = int(os.getenv("LLM_MAX_QUEUED_PER_USER", "8"))
+        anonymous_rate_per_minute = float(os.getenv("LLM_ANONYMOUS_RATE_PER_MINUTE", "120"))
+        anonymous_burst = int(os.getenv("LLM_ANONYMOUS_BURST", "20"))
+        max_queued_anonymous = int(os.getenv("LLM_MAX_QUEUED_ANONYMOUS", "32"))
+        anonymous_weight = float(os.getenv("LLM_ANONYMOUS_WEIGHT", "4"))
+        
+        llm_scheduler = LLMScheduler(
+            ollama_service=ollama_service or OllamaService(),
+            max_concurrent=max_concurrent,
+            user_rate_per_minute=user_rate_per_minute,
+            user_burst=user_burst,
+            max_queued_per_user=max_queued_per_user,
+            anonymous_rate_per_minute=anonymous_rate_per_minute,
+            anonymous_burst=anonymous_burst,
+            max_queued_anonymous=max_queued_anonymous,
+            anonymous_weight=anonymous_weight
+        )
+    
+    return llm_scheduler
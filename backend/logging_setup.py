@@ -0,0 +1,265 @@
+"""
+Non-blocking logging pipeline
+Log calls only put the record on a queue; formatting and writing happen on
+a background listener thread. Per-request INFO lines are sampled, extra
+fields are rendered as key=value (or JSON), and user content is redacted
+before anything is written.
+
+Hot-path lines use lazy %-formatting and pass values as fields:
+    logger.info("Transcribed %d chars", len(text), extra=sampled(transcript=text))
+
+Records are formatted later on another thread, so only pass immutable
+values (numbers, strings) as arguments and fields.
+"""
+import os
+import sys
+import json
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+import contextvars
+from typing import Optional
+
+# Fields holding user content: only their length is written
+# (unless LOG_USER_CONTENT=true, for local debugging)
+REDACTED_FIELDS = {"text", "transcript", "reply", "message", "content"}
+
+# Loggers whose INFO lines are per-request and sampled like sampled()
+SAMPLED_LOGGERS = {"uvicorn.access"}
+
+# Keep/drop decision for the current request or voice turn
+_request_sampled: contextvars.ContextVar[Optional[bool]] = contextvars.ContextVar(
+    "request_sampled", default=None
+)
+
+
+def sampled(**fields) -> dict:
+    """
+    extra= for a per-request INFO line
+    
+    Args:
+        **fields: Structured fields written with the line
+    
+    Returns:
+        Dict for the extra argument of a logging call
+    """
+    return {"sampled": True, "fields": fields}
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a fraction of sampled INFO lines
+    Warnings and errors always pass. Inside sample_request() the decision
+    is made once, so a sampled request is logged completely.
+    """
+    
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+        self.dropped = 0
+    
+    def decide(self) -> bool:
+        return self.rate >= 1.0 or random.random() < self.rate
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+        if not getattr(record, "sampled", False) and record.name not in SAMPLED_LOGGERS:
+            return True
+        
+        keep = _request_sampled.get()
+        if keep is None:
+            keep = self.decide()
+        if not keep:
+            self.dropped += 1
+        return keep
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that defers formatting and drops records when the queue is full"""
+    
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same process: no need to pre-format or pickle, the listener does it
+        return record
+    
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredFormatter(logging.Formatter):
+    """Formats records with their fields, redacting user content"""
+    
+    def __init__(self, json_output: bool = False, show_user_content: bool = False):
+        super().__init__('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+        self.json_output = json_output
+        self.show_user_content = show_user_content
+    
+    def _fields(self, record: logging.LogRecord) -> dict:
+        values = getattr(record, "fields", None) or {}
+        if self.show_user_content:
+            return values
+        return {
+            key: f"<redacted {len(str(value))} chars>" if key in REDACTED_FIELDS and value is not None else value
+            for key, value in values.items()
+        }
+    
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        values = self._fields(record)
+        if values:
+            line += " " + " ".join(f"{key}={value}" for key, value in values.items())
+        return line
+    
+    def format(self, record: logging.LogRecord) -> str:
+        if not self.json_output:
+            return super().format(record)
+        
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **self._fields(record)
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class LogPipeline:
+    """Root logging through a queue and a background writer thread"""
+    
+    def __init__(
+        self,
+        level: int = logging.INFO,
+        sample_rate: float = 1.0,
+        queue_size: int = 10000,
+        json_output: bool = False,
+        show_user_content: bool = False,
+        stream=None
+    ):
+        """
+        Initialize logging pipeline
+        
+        Args:
+            level: Root log level
+            sample_rate: Fraction of sampled INFO lines written (0-1)
+            queue_size: Records buffered before new ones are dropped
+            json_output: One JSON object per line instead of text
+            show_user_content: Write REDACTED_FIELDS as is (never in production)
+            stream: Output stream (default: stderr)
+        """
+        self.level = level
+        self.sample_rate = sample_rate
+        self.queue: queue.Queue = queue.Queue(maxsize=queue_size)
+        
+        self.sampling = SamplingFilter(sample_rate)
+        self.handler = NonBlockingQueueHandler(self.queue)
+        self.handler.addFilter(self.sampling)
+        
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(StructuredFormatter(json_output, show_user_content))
+        self.listener = logging.handlers.QueueListener(self.queue, output, respect_handler_level=True)
+    
+    def install(self):
+        """Route the root logger (and uvicorn's loggers) through the queue"""
+        root = logging.getLogger()
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        self.route_uvicorn()
+        
+        self.listener.start()
+        atexit.register(self.stop)
+    
+    def route_uvicorn(self):
+        """Send uvicorn's loggers through the root logger's queue"""
+        # uvicorn writes synchronously with its own handlers otherwise
+        for name in ("uvicorn", "uvicorn.error", "uvicorn.access"):
+            uvicorn_logger = logging.getLogger(name)
+            uvicorn_logger.handlers = []
+            uvicorn_logger.propagate = True
+    
+    def stop(self):
+        """Write out queued records and stop the writer thread"""
+        if self.listener._thread is not None:
+            try:
+                self.listener.stop()
+            except queue.Full:
+                pass
+    
+    def sample_request(self) -> bool:
+        """
+        Decide for the current request or voice turn whether its sampled
+        lines are written (applies to tasks started from this context)
+        
+        Returns:
+            True if the lines are kept
+        """
+        keep = self.sampling.decide()
+        _request_sampled.set(keep)
+        return keep
+    
+    def get_stats(self) -> dict:
+        """Get pipeline counters"""
+        return {
+            "sample_rate": self.sample_rate,
+            "queued": self.queue.qsize(),
+            "dropped_queue_full": self.handler.dropped,
+            "sampled_out": self.sampling.dropped
+        }
+
+
+# Global instance (singleton)
+log_pipeline: Optional[LogPipeline] = None
+
+
+def configure_logging() -> LogPipeline:
+    """
+    Set up the logging pipeline from the environment (once per process)
+    
+    Later calls only re-route uvicorn's loggers, in case uvicorn's own
+    logging config replaced their handlers in the meantime.
+    """
+    global log_pipeline
+    
+    if log_pipeline is None:
+        level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+        default_rate = "1.0" if os.getenv("ENVIRONMENT", "development") == "development" else "0.1"
+        sample_rate = float(os.getenv("LOG_SAMPLE_RATE", default_rate))
+        queue_size = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+        json_output = os.getenv("LOG_FORMAT", "text").lower() == "json"
+        show_user_content = os.getenv("LOG_USER_CONTENT", "false").lower() == "true"
+        
+        log_pipeline = LogPipeline(
+            level=level,
+            sample_rate=sample_rate,
+            queue_size=queue_size,
+            json_output=json_output,
+            show_user_content=show_user_content
+        )
+        log_pipeline.install()
+    else:
+        log_pipeline.route_uvicorn()
+    
+    return log_pipeline
+
+
+def sample_request() -> bool:
+    """Per-request sampling decision (keeps everything before configure_logging)"""
+    return log_pipeline.sample_request() if log_pipeline else True
+
+
+def get_logging_stats() -> dict:
+    """Get logging pipeline counters"""
+    return log_pipeline.get_stats() if log_pipeline else {}
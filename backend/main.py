@@ -2,28 +2,40 @@
 LENTERA Backend - FastAPI Server
 Provides AI-powered mental health counseling services with voice support
 """
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, UploadFile, File, HTTPException
+from startup_report import get_startup_report, preload_heavy_modules
+from fastapi import FastAPI, WebSocket, UploadFile, File, HTTPException, Request, Header
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
-from pydantic import BaseModel
+from fastapi.responses import Response, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
 import asyncio
 import json
-import base64
-from typing import Optional
+import math
+import hashlib
+from datetime import date, datetime, timezone
+from typing import List, Optional, Tuple
 import os
 import logging
 
 # Import services
 from ollama_service import OllamaService, MENTAL_HEALTH_SYSTEM_PROMPT
+from llm_scheduler import PRIORITY_BATCH, PRIORITY_CHAT, PRIORITY_VOICE, RateLimitExceeded, get_llm_scheduler
 from whisper_service import get_whisper_service
-from tts_service import get_tts_service
-from audio_utils import AudioUtils
+from tts_service import TTSService, get_tts_service
+from audio_utils import AudioUtils, get_speech_filter_stats
+from transcription_jobs import get_transcription_job_manager
+from voice_call import VoiceCallSession, get_voice_call_stats
+from traffic_recorder import TrafficRecorderMiddleware
+from crisis_detector import SAFETY_MESSAGE, get_crisis_detector
+from mood_analytics import MAX_TAGS_PER_ENTRY, MoodAnalytics
+from semantic_cache import get_semantic_cache
+from logging_setup import configure_logging, get_logging_stats, sample_request
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Heavy modules (numpy, faster_whisper, edge_tts, ...) are imported lazily
+startup_report = get_startup_report()
+startup_report.milestone("app_imported")
+
+# Configure logging (queued, sampled and redacted; see logging_setup.py)
+configure_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(
@@ -41,8 +53,102 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# uvicorn worker processes; jobs, scheduler state and caches live in each one.
+# Client mode is the multi-worker setup: the count must be given explicitly,
+# "uvicorn --workers N" alone would leave every worker thinking it is alone
+if os.getenv("WHISPER_MODE", "local") == "client" and "API_WORKERS" not in os.environ:
+    raise RuntimeError("WHISPER_MODE=client requires API_WORKERS (start with: API_WORKERS=N python main.py)")
+API_WORKERS = max(1, int(os.getenv("API_WORKERS", "1")))
+
+# Endpoints that accept audio uploads
+AUDIO_UPLOAD_PATHS = {"/api/voice/transcribe", "/api/voice/jobs"}
+
+# Allowance for multipart boundaries and form headers
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+
+
+class UploadTooLarge(Exception):
+    """Raised from receive() once an audio upload passes the size limit"""
+
+
+class AudioUploadLimitMiddleware:
+    """
+    ASGI middleware enforcing the audio upload size limit on the raw body
+    Requests announcing a larger Content-Length are rejected before any
+    body is read; chunked uploads are cut off as soon as the bytes received
+    pass the limit, before FastAPI has parsed the whole multipart body.
+    """
+    
+    def __init__(self, app, max_bytes: Optional[int] = None):
+        self.app = app
+        self.max_bytes = max_bytes or AudioUtils.MAX_UPLOAD_BYTES + MULTIPART_OVERHEAD_BYTES
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in AUDIO_UPLOAD_PATHS:
+            await self.app(scope, receive, send)
+            return
+        
+        content_length = dict(scope["headers"]).get(b"content-length", b"")
+        if content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(scope, receive, send)
+            return
+        
+        received = 0
+        too_large = False
+        response_started = False
+        
+        async def receive_wrapper():
+            nonlocal received, too_large
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    too_large = True
+                    raise UploadTooLarge()
+            return message
+        
+        async def send_wrapper(message):
+            nonlocal response_started
+            if too_large and not response_started:
+                # Body parsing failed because of the limit: answer 413 instead
+                return
+            response_started = True
+            await send(message)
+        
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        except UploadTooLarge:
+            pass
+        
+        if too_large and not response_started:
+            await self._reject(scope, receive, send)
+    
+    @staticmethod
+    async def _reject(scope, receive, send):
+        response = JSONResponse(
+            status_code=413,
+            content={"detail": f"Audio file too large: more than {AudioUtils.MAX_UPLOAD_BYTES} bytes"}
+        )
+        await response(scope, receive, send)
+
+
+app.add_middleware(AudioUploadLimitMiddleware)
+
+# Opt-in anonymized traffic capture for replay_traffic.py (TRAFFIC_RECORD_PATH);
+# added after the upload limit so rejected uploads are recorded as 413
+app.add_middleware(TrafficRecorderMiddleware)
+
+@app.middleware("http")
+async def sample_request_logs(request: Request, call_next):
+    """Make the per-request log sampling decision"""
+    sample_request()
+    return await call_next(request)
+
 # Initialize services
 ollama_service = OllamaService()
+llm_scheduler = get_llm_scheduler(ollama_service)
+crisis_detector = get_crisis_detector()
+semantic_cache = get_semantic_cache(ollama_service)
 whisper_service = None
 tts_service = None
 
@@ -55,6 +161,27 @@ class ChatMessage(BaseModel):
 class TTSRequest(BaseModel):
     text: str
     voice: Optional[str] = None
+    output_format: Optional[str] = None  # mp3, opus, ogg, pcm, wav
+
+class MoodEntry(BaseModel):
+    id: Optional[str] = None
+    user_id: Optional[str] = None
+    mood_rating: int = Field(ge=1, le=5)
+    mood_tags: List[str] = Field(default=[], max_length=MAX_TAGS_PER_ENTRY)
+    journal_text: Optional[str] = None
+    audio_url: Optional[str] = None
+    transcription: Optional[str] = None
+    created_at: datetime
+
+# Upper bound on history sent to /api/mood/trends
+MAX_MOOD_TREND_ENTRIES = int(os.getenv("MOOD_TRENDS_MAX_ENTRIES", "5000"))
+
+class MoodTrendsRequest(BaseModel):
+    entries: List[MoodEntry] = Field(max_length=MAX_MOOD_TREND_ENTRIES)
+    user_id: Optional[str] = None
+    window_days: int = Field(default=7, ge=1, le=90)
+    as_of: Optional[date] = None  # today in the user's time zone, for current streaks
+    summary: bool = True  # one LLM call for a narrative; false for numbers only
 
 class VoiceResponse(BaseModel):
     transcript: str
@@ -65,25 +192,49 @@ class VoiceResponse(BaseModel):
 # Startup event - initialize services
 @app.on_event("startup")
 async def startup_event():
-    """Initialize services on startup"""
+    """
+    Create services on startup
+    Only cheap setup happens here so the server accepts requests at once;
+    imports and the Whisper model load continue in warm_up_services()
+    """
     global whisper_service, tts_service
     
     logger.info("Starting LENTERA Backend...")
     
-    # Initialize Whisper
     try:
         whisper_service = get_whisper_service()
-        await whisper_service.initialize()
-        logger.info("✓ Whisper STT initialized")
     except Exception as e:
-        logger.error(f"✗ Failed to initialize Whisper: {e}")
+        logger.error(f"✗ Failed to create Whisper service: {e}")
     
-    # Initialize TTS
     try:
         tts_service = get_tts_service()
-        logger.info("✓ Edge TTS initialized")
     except Exception as e:
-        logger.error(f"✗ Failed to initialize TTS: {e}")
+        logger.error(f"✗ Failed to create TTS service: {e}")
+    
+    asyncio.create_task(warm_up_services())
+    startup_report.milestone("accepting_requests")
+
+async def warm_up_services():
+    """Import heavy modules and load models in the background"""
+    with startup_report.measure("preload", "import"):
+        await asyncio.to_thread(preload_heavy_modules)
+    
+    # Initialize Whisper (requests arriving earlier wait for the same load)
+    if whisper_service:
+        try:
+            await whisper_service.initialize()
+            logger.info("✓ Whisper STT initialized")
+        except Exception as e:
+            logger.error(f"✗ Failed to initialize Whisper: {e}")
+    
+    # Safety response must be ready before the first crisis message
+    if tts_service:
+        try:
+            with startup_report.measure("tts", "safety_audio"):
+                await crisis_detector.warm_up(tts_service)
+            logger.info("✓ Edge TTS initialized")
+        except Exception as e:
+            logger.error(f"✗ Failed to initialize TTS: {e}")
     
     # Check Ollama
     try:
@@ -95,11 +246,13 @@ async def startup_event():
     except Exception as e:
         logger.error(f"✗ Ollama check failed: {e}")
     
-    logger.info("LENTERA Backend ready! 🚀")
+    startup_report.milestone("services_ready")
+    logger.info(f"LENTERA Backend ready! 🚀 {startup_report.to_dict()}")
 
 # Health check endpoint
 @app.get("/")
 async def root():
+    startup_report.milestone("first_response")
     return {
         "status": "healthy",
         "service": "LENTERA Backend API",
@@ -127,62 +280,233 @@ async def health_check():
         }
     }
 
+@app.get("/metrics")
+async def metrics():
+    """Runtime counters for caches and pipelines"""
+    return {
+        "transcript_cache": (
+            whisper_service.transcript_cache.get_stats()
+            if whisper_service and whisper_service.transcript_cache else {}
+        ),
+        "voice_call": get_voice_call_stats(),
+        "speech_filter": get_speech_filter_stats(),
+        "llm_scheduler": llm_scheduler.get_stats(),
+        "crisis": crisis_detector.get_stats(),
+        "semantic_cache": semantic_cache.get_stats(),
+        "startup": startup_report.to_dict(),
+        "logging": get_logging_stats()
+    }
+
 # Chat endpoint (REST API)
 @app.post("/api/chat")
-async def chat(message: ChatMessage):
+async def chat(message: ChatMessage, accept: Optional[str] = Header(None)):
     """
     Process text chat messages with AI
+    
+    With "Accept: text/event-stream" the answer comes as Server-Sent Events:
+    for crisis messages a "safety" event with the hotline text is sent right
+    away, and the "reply" event follows once the LLM has answered.
     """
     try:
-        # Prepare messages for Ollama
-        messages = [
-            {"role": "system", "content": MENTAL_HEALTH_SYSTEM_PROMPT},
-            {"role": "user", "content": message.message}
-        ]
-        
-        # Get response from Ollama
-        response = await ollama_service.chat(messages)
-        
-        if "error" in response:
-            raise HTTPException(status_code=500, detail=response["error"])
+        # Crisis phrases: hotline information goes with the reply (safety_message)
+        crisis = bool(crisis_detector.detect(message.message))
+        if crisis:
+            logger.warning("Crisis phrases detected in chat message, adding safety response")
         
-        ai_message = response.get("message", {}).get("content", "")
+        if accept and "text/event-stream" in accept:
+            return StreamingResponse(chat_events(message, crisis), media_type="text/event-stream")
         
-        return {
-            "message": ai_message,
-            "conversation_id": message.conversation_id or "new-conv-id",
-            "timestamp": response.get("created_at", "")
-        }
+        return await chat_reply(message, crisis)
         
+    except RateLimitExceeded as e:
+        raise rate_limited(e)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Chat error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def chat_events(message: ChatMessage, crisis: bool):
+    """Server-Sent Events for /api/chat: safety text first, then the reply"""
+    if crisis:
+        yield f"data: {json.dumps({'type': 'safety', 'crisis': True, 'safety_message': SAFETY_MESSAGE})}\n\n"
+    
+    try:
+        reply = await chat_reply(message, crisis)
+        event = {"type": "reply", **reply}
+    except RateLimitExceeded as e:
+        event = {"type": "error", "status": 429, "detail": "Too many requests, please slow down",
+                 "retry_after": max(1, math.ceil(e.retry_after))}
+    except HTTPException as e:
+        event = {"type": "error", "status": e.status_code, "detail": e.detail}
+    except Exception as e:
+        logger.error(f"Chat error: {e}")
+        event = {"type": "error", "status": 500, "detail": str(e)}
+    
+    yield f"data: {json.dumps(event)}\n\n"
+
+async def chat_reply(message: ChatMessage, crisis: bool) -> dict:
+    """Answer a chat message from the semantic cache or the LLM"""
+    # Paraphrases of earlier questions reuse their answer (SEMANTIC_CACHE_SIZE)
+    cached_message, embedding = (None, None) if crisis else await semantic_cache.lookup(message.message, user_id=message.user_id)
+    if cached_message is not None:
+        return {
+            "message": cached_message,
+            "conversation_id": message.conversation_id or "new-conv-id",
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "crisis": False,
+            "safety_message": None,
+            "cached": True
+        }
+    
+    # Prepare messages for Ollama
+    messages = [
+        {"role": "system", "content": MENTAL_HEALTH_SYSTEM_PROMPT},
+        {"role": "user", "content": message.message}
+    ]
+    
+    # Get response from Ollama (fair-shared across users); crisis messages
+    # skip the chat and batch backlog like voice turns
+    try:
+        response = await llm_scheduler.chat(
+            messages,
+            user_id=message.user_id,
+            priority=PRIORITY_VOICE if crisis else PRIORITY_CHAT
+        )
+    except RateLimitExceeded as e:
+        if not crisis:
+            raise
+        response = {"error": str(e)}
+    
+    if "error" in response:
+        if not crisis:
+            raise HTTPException(status_code=500, detail=response["error"])
+        # Never answer a crisis message with an error: the safety text stands alone
+        logger.error(f"Chat error on crisis message: {response['error']}")
+        response = {"message": {"content": SAFETY_MESSAGE}}
+    
+    ai_message = response.get("message", {}).get("content", "")
+    if not crisis:
+        semantic_cache.put(message.message, embedding, ai_message, user_id=message.user_id)
+    
+    return {
+        "message": ai_message,
+        "conversation_id": message.conversation_id or "new-conv-id",
+        "timestamp": response.get("created_at", "") or datetime.now(timezone.utc).isoformat(),
+        "crisis": crisis,
+        "safety_message": SAFETY_MESSAGE if crisis else None,
+        "cached": False
+    }
+
+def rate_limited(error: RateLimitExceeded) -> HTTPException:
+    """429 response telling the client when to retry"""
+    return HTTPException(
+        status_code=429,
+        detail="Too many requests, please slow down",
+        headers={"Retry-After": str(max(1, math.ceil(error.retry_after)))}
+    )
+
+async def spool_audio_upload(audio: UploadFile, hasher=None) -> Tuple[str, dict]:
+    """
+    Stream an upload to disk and check its duration from metadata
+    
+    Returns:
+        Tuple of (temp_file_path, audio_info); the caller deletes the file
+    """
+    # Stream upload to disk, stopping early if it exceeds the size limit
+    audio_path, error = await AudioUtils.spool_upload(audio, hasher=hasher)
+    if error:
+        raise HTTPException(status_code=413, detail=error)
+    
+    # Check duration from container metadata before decoding anything
+    audio_info = await asyncio.to_thread(AudioUtils.probe_audio, audio_path)
+    duration = audio_info.get("duration_seconds")
+    if duration and duration > AudioUtils.MAX_DURATION_SECONDS:
+        os.unlink(audio_path)
+        raise HTTPException(
+            status_code=400,
+            detail=f"Audio too long: {duration:.1f}s > {AudioUtils.MAX_DURATION_SECONDS}s"
+        )
+    
+    return audio_path, audio_info
+
+async def decode_audio_upload(audio_path: str, audio_info: dict):
+    """
+    Decode a spooled upload to 16kHz mono samples and validate it
+    
+    Returns:
+        Float32 samples; audio_info is updated with duration and level
+    """
+    # Decode once; stop just past the limit for containers without duration
+    try:
+        samples = await asyncio.to_thread(
+            AudioUtils.load_pcm,
+            audio_path,
+            max_duration=AudioUtils.MAX_DURATION_SECONDS + 1
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid audio format: {e}")
+    
+    # Validate audio
+    is_valid, error = AudioUtils.validate_samples(samples)
+    if not is_valid:
+        raise HTTPException(status_code=400, detail=error)
+    
+    audio_info["duration_seconds"] = len(samples) / AudioUtils.TARGET_SAMPLE_RATE
+    audio_info["dBFS"] = AudioUtils.samples_dBFS(samples)
+    
+    return samples
+
 # Voice transcription endpoint (test STT)
 @app.post("/api/voice/transcribe")
 async def transcribe_audio(audio: UploadFile = File(...)):
     """
     Transcribe audio file to text (STT test endpoint)
+    
+    The upload is streamed to a temporary file and decoded once, straight
+    into the PCM array Whisper consumes, so memory stays bounded.
     """
+    audio_path = None
     try:
-        # Read audio file
-        audio_data = await audio.read()
+        hasher = hashlib.blake2b(digest_size=16)
+        audio_path, audio_info = await spool_audio_upload(audio, hasher=hasher)
+        
+        # Retried uploads are answered from the transcript cache
+        cache_key = whisper_service.cache_key(hasher.hexdigest())
+        cached = whisper_service.get_cached_transcript(cache_key)
+        if cached is not None:
+            transcript, confidence = cached
+            return {
+                "transcript": transcript,
+                "confidence": confidence,
+                "audio_info": audio_info,
+                "cached": True
+            }
         
-        # Validate audio
-        is_valid, error = AudioUtils.validate_audio(audio_data)
-        if not is_valid:
-            raise HTTPException(status_code=400, detail=error)
+        samples = await decode_audio_upload(audio_path, audio_info)
         
-        # Get audio info
-        audio_info = AudioUtils.get_audio_info(audio_data)
+        # Drop leading/trailing silence so Whisper decodes less audio
+        samples = AudioUtils.trim_silence(samples)
+        
+        # Noise, pocket recordings and taps never reach Whisper
+        has_speech, no_speech_reason = await asyncio.to_thread(AudioUtils.detect_speech, samples)
+        if not has_speech:
+            return {
+                "transcript": "",
+                "confidence": 0.0,
+                "audio_info": audio_info,
+                "cached": False,
+                "no_speech_reason": no_speech_reason
+            }
         
         # Transcribe with Whisper
-        transcript, confidence = await whisper_service.transcribe_audio(audio_data)
+        transcript, confidence = await whisper_service.transcribe_audio(samples, cache_key=cache_key)
         
         return {
             "transcript": transcript,
             "confidence": confidence,
-            "audio_info": audio_info
+            "audio_info": audio_info,
+            "cached": False
         }
         
     except HTTPException:
@@ -190,23 +514,103 @@ async def transcribe_audio(audio: UploadFile = File(...)):
     except Exception as e:
         logger.error(f"Transcription error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if audio_path and os.path.exists(audio_path):
+            os.unlink(audio_path)
+
+# Long recordings: background transcription jobs
+@app.post("/api/voice/jobs", status_code=202)
+async def create_transcription_job(audio: UploadFile = File(...), language: Optional[str] = None):
+    """
+    Submit a long recording for background transcription
+    
+    Returns a job id immediately; poll /api/voice/jobs/{job_id} or stream
+    progress from /api/voice/jobs/{job_id}/events.
+    """
+    if API_WORKERS > 1:
+        # Job state is per process: status polls would land on other workers
+        raise HTTPException(
+            status_code=503,
+            detail="Transcription jobs need API_WORKERS=1 (job state is kept per worker process)"
+        )
+    
+    job_manager = get_transcription_job_manager()
+    if job_manager.active_jobs() >= job_manager.max_active_jobs:
+        raise HTTPException(status_code=429, detail="Too many transcription jobs in progress")
+    
+    audio_path = None
+    try:
+        audio_path, audio_info = await spool_audio_upload(audio)
+        samples = await decode_audio_upload(audio_path, audio_info)
+        
+        job = job_manager.submit(samples, language=language)
+        
+        return {
+            "job_id": job.id,
+            "status": job.status,
+            "audio_info": audio_info,
+            "status_url": f"/api/voice/jobs/{job.id}",
+            "events_url": f"/api/voice/jobs/{job.id}/events"
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Transcription job error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if audio_path and os.path.exists(audio_path):
+            os.unlink(audio_path)
+
+@app.get("/api/voice/jobs/{job_id}")
+async def get_transcription_job(job_id: str):
+    """Get status, progress and (when completed) the transcript of a job"""
+    job = get_transcription_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@app.get("/api/voice/jobs/{job_id}/events")
+async def stream_transcription_job(job_id: str):
+    """Stream job progress as Server-Sent Events until it finishes"""
+    job = get_transcription_job_manager().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    async def event_stream():
+        async for snapshot in job.watch():
+            yield f"data: {json.dumps(snapshot)}\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
 
 # Voice synthesis endpoint (test TTS)
 @app.post("/api/voice/synthesize")
-async def synthesize_speech(request: TTSRequest):
+async def synthesize_speech(request: TTSRequest, accept: Optional[str] = Header(None)):
     """
     Convert text to speech (TTS test endpoint)
+    
+    The format is taken from output_format, else from the Accept header,
+    else the server default (mp3).
     """
+    try:
+        output_format = tts_service.resolve_output_format(
+            request.output_format
+            or TTSService.format_from_accept(accept)
+            or tts_service.default_output_format
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
     try:
         # Synthesize
-        audio_data = await tts_service.synthesize(request.text)
+        audio_data = await tts_service.synthesize(request.text, output_format)
         
-        # Return audio as MP3
+        format_info = TTSService.OUTPUT_FORMATS[output_format]
         return Response(
             content=audio_data,
-            media_type="audio/mpeg",
+            media_type=format_info["media_type"],
             headers={
-                "Content-Disposition": "attachment; filename=speech.mp3"
+                "Content-Disposition": f"attachment; filename=speech.{format_info['extension']}"
             }
         )
         
@@ -221,62 +625,14 @@ async def voice_call_websocket(websocket: WebSocket):
     WebSocket endpoint untuk real-time voice call
     Complete pipeline: Audio → STT → LLM → TTS → Audio
     """
-    await websocket.accept()
-    logger.info("Voice call WebSocket connected")
-    
-    try:
-        while True:
-            # Receive audio data from client
-            data = await websocket.receive_bytes()
-            
-            logger.info(f"Received audio: {len(data)} bytes")
-            
-            try:
-                # Step 1: Convert audio to WAV if needed
-                wav_data = AudioUtils.convert_to_wav(data, "webm")
-                
-                # Step 2: Transcribe with Whisper (STT)
-                transcript, confidence = await whisper_service.transcribe_audio(wav_data)
-                logger.info(f"Transcribed: '{transcript}' (confidence: {confidence:.2f})")
-                
-                # Step 3: Get AI response from Ollama
-                messages = [
-                    {"role": "system", "content": MENTAL_HEALTH_SYSTEM_PROMPT},
-                    {"role": "user", "content": transcript}
-                ]
-                
-                llm_response = await ollama_service.chat(messages)
-                ai_text = llm_response.get("message", {}).get("content", "Maaf, saya tidak mengerti.")
-                logger.info(f"AI response: '{ai_text[:50]}...'")
-                
-                # Step 4: Convert AI response to speech (TTS)
-                audio_response = await tts_service.synthesize(ai_text)
-                audio_base64 = base64.b64encode(audio_response).decode('utf-8')
-                
-                # Step 5: Send response back to client
-                response = {
-                    "type": "voice_response",
-                    "transcript": transcript,
-                    "ai_response": ai_text,
-                    "audio_base64": audio_base64,
-                    "confidence": confidence
-                }
-                
-                await websocket.send_json(response)
-                logger.info("Voice response sent")
-                
-            except Exception as e:
-                logger.error(f"Voice pipeline error: {e}")
-                error_response = {
-                    "type": "error",
-                    "message": f"Processing error: {str(e)}"
-                }
-                await websocket.send_json(error_response)
-            
-    except WebSocketDisconnect:
-        logger.info("Client disconnected from voice call")
-    except Exception as e:
-        logger.error(f"WebSocket error: {e}")
+    session = VoiceCallSession(
+        websocket,
+        whisper_service,
+        llm_scheduler,
+        tts_service,
+        user_id=websocket.query_params.get("user_id")
+    )
+    await session.run()
 
 # Mood analysis endpoint
 @app.post("/api/mood/analyze")
@@ -310,7 +666,8 @@ async def analyze_mood(data: dict):
             {"role": "user", "content": prompt}
         ]
         
-        response = await ollama_service.chat(messages)
+        # Mood analysis can wait behind interactive chat and voice turns
+        response = await llm_scheduler.chat(messages, user_id=data.get("user_id"), priority=PRIORITY_BATCH)
         ai_analysis = response.get("message", {}).get("content", "")
         
         return {
@@ -319,17 +676,69 @@ async def analyze_mood(data: dict):
             "timestamp": response.get("created_at", "")
         }
         
+    except RateLimitExceeded as e:
+        raise rate_limited(e)
     except Exception as e:
         logger.error(f"Mood analysis error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+# Mood trends endpoint
+@app.post("/api/mood/trends")
+async def mood_trends(request: MoodTrendsRequest):
+    """
+    Aggregate a user's mood history for insight screens
+    Statistics are computed locally; the LLM is called at most once, for a
+    short summary of the numbers (never per entry)
+    """
+    try:
+        entries = [entry.model_dump(include={"mood_rating", "mood_tags", "created_at"}) for entry in request.entries]
+        try:
+            trends = MoodAnalytics.compute_trends(entries, request.window_days, request.as_of)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        trends["summary"] = None
+        
+        if request.summary and trends["entries"]:
+            messages = [
+                {"role": "system", "content": MENTAL_HEALTH_SYSTEM_PROMPT},
+                {"role": "user", "content": MoodAnalytics.build_summary_prompt(trends)}
+            ]
+            user_id = request.user_id or next((e.user_id for e in request.entries if e.user_id), None)
+            
+            try:
+                response = await llm_scheduler.chat(messages, user_id=user_id, priority=PRIORITY_BATCH)
+                trends["summary"] = response.get("message", {}).get("content") or None
+            except RateLimitExceeded:
+                # Numbers are still useful without the narrative
+                logger.info("Mood trend summary skipped: rate limited")
+        
+        return trends
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Mood trends error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 if __name__ == "__main__":
     import uvicorn
+    
+    # Several workers only make sense with WHISPER_MODE=client (see stt_server.py)
+    workers = API_WORKERS
+    if workers > 1:
+        logger.warning(
+            f"API_WORKERS={workers}: transcription jobs are disabled; LLM_MAX_CONCURRENT is split "
+            "across workers, per-user rate limits and caches apply per worker"
+        )
     uvicorn.run(
         "main:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
-        log_level="info"
+        workers=workers,
+        reload=os.getenv("ENVIRONMENT", "development") == "development" and workers == 1,
+        log_level="info",
+        # Keep the queued pipeline from configure_logging(); uvicorn's
+        # default dictConfig would put its synchronous handlers back
+        log_config=None
     )
 
@@ -0,0 +1,335 @@
+"""
+Mood trend analytics
+Aggregates a user's mood history (moving averages, volatility, weekday
+patterns, emotion co-occurrence, streaks) with vectorized NumPy, so
+insight screens do not need an LLM call per entry
+"""
+from __future__ import annotations
+import json
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from startup_report import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+UNIX_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# Daily averages at or above / at or below these count towards streaks
+GOOD_MOOD_THRESHOLD = 4.0
+LOW_MOOD_THRESHOLD = 2.0
+
+# Limits on what is returned for the emotion matrix
+MAX_EMOTIONS = 15
+MAX_EMOTION_PAIRS = 10
+
+# Only the most frequent tags enter the entry x tag matrix
+MAX_MATRIX_TAGS = 50
+
+# Tags beyond this per entry are ignored
+MAX_TAGS_PER_ENTRY = 20
+
+# Longest history (up to as_of) one request covers; older entries are left
+# out ("truncated": true). The daily series has one row per day of it
+MAX_SPAN_DAYS = 3 * 366
+
+# as_of may be at most this many days after today (time zones)
+MAX_FUTURE_DAYS = 1
+
+
+def _round(value: float, digits: int = 2) -> Optional[float]:
+    """JSON-friendly rounding (NaN becomes None)"""
+    return None if value is None or np.isnan(value) else round(float(value), digits)
+
+
+def _round_array(values: np.ndarray, digits: int = 2) -> list:
+    """Vectorized _round, returned as a list"""
+    rounded = np.round(values, digits)
+    return np.where(np.isnan(rounded), None, rounded).tolist()
+
+
+def _runs(mask: np.ndarray) -> np.ndarray:
+    """
+    Lengths of consecutive True runs, in order
+    
+    Args:
+        mask: Boolean array
+    
+    Returns:
+        Array of run lengths
+    """
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[1::2] - edges[::2]
+
+
+class MoodAnalytics:
+    """Vectorized statistics over mood entries"""
+    
+    @staticmethod
+    def compute_trends(
+        entries: List[dict],
+        window_days: int = 7,
+        as_of: Optional[date] = None
+    ) -> dict:
+        """
+        Compute mood trends for one user
+        
+        Args:
+            entries: Mood entries with mood_rating (1-5), mood_tags and
+                     created_at (datetime in the user's local time)
+            window_days: Moving average / recent volatility window
+            as_of: Day the current streaks are measured to (default: last entry)
+        
+        Returns:
+            Trend statistics; only the last MAX_SPAN_DAYS are covered
+            ("truncated" tells whether older entries were left out)
+        
+        Raises:
+            ValueError: as_of is in the future
+        """
+        if as_of and as_of > date.today() + timedelta(days=MAX_FUTURE_DAYS):
+            raise ValueError(f"as_of {as_of} is in the future")
+        
+        if not entries:
+            return {"entries": 0, "truncated": False}
+        
+        # Local wall-clock time: the user's calendar day is what matters.
+        # Plain ordinals avoid NumPy's slow datetime object conversion.
+        n = len(entries)
+        created = [entry["created_at"] for entry in entries]
+        ordinals = np.fromiter((c.toordinal() for c in created), dtype=np.int64, count=n)
+        seconds = np.fromiter((c.hour * 3600 + c.minute * 60 + c.second for c in created), dtype=np.int64, count=n)
+        
+        order = np.argsort(ordinals * 86400 + seconds, kind="stable")
+        last_ordinal = max(as_of.toordinal() if as_of else 0, int(ordinals[order[-1]]))
+        
+        # Bound the work: only the last MAX_SPAN_DAYS up to as_of count
+        order = order[ordinals[order] > last_ordinal - MAX_SPAN_DAYS]
+        truncated = len(order) < n
+        if not len(order):
+            return {"entries": 0, "truncated": truncated}
+        
+        ratings = np.fromiter((entry["mood_rating"] for entry in entries), dtype=np.float64, count=n)[order]
+        tags = [(entries[i].get("mood_tags") or [])[:MAX_TAGS_PER_ENTRY] for i in order]
+        
+        days = (ordinals[order] - UNIX_EPOCH_ORDINAL).astype("datetime64[D]")
+        first_day = days[0]
+        last_day = np.datetime64(last_ordinal - UNIX_EPOCH_ORDINAL, "D")
+        day_index = (days - first_day).astype(np.int64)
+        span = int((last_day - first_day).astype(np.int64)) + 1
+        
+        daily = MoodAnalytics._daily_series(day_index, ratings, span, window_days)
+        
+        return {
+            "entries": len(order),
+            "truncated": truncated,
+            "first_day": str(first_day),
+            "last_day": str(last_day),
+            "overall": {
+                "average": _round(ratings.mean()),
+                "median": _round(np.median(ratings)),
+                "distribution": {
+                    str(r): int(c) for r, c in zip(range(1, 6), np.bincount(ratings.astype(np.int64), minlength=6)[1:6])
+                },
+                "trend_per_week": MoodAnalytics._trend_per_week(day_index, ratings)
+            },
+            "daily": [
+                {"date": day, "average": average, "moving_average": moving_average, "entries": count}
+                for day, average, moving_average, count in zip(
+                    np.datetime_as_string(first_day + np.arange(span)).tolist(),
+                    _round_array(daily["average"]),
+                    _round_array(daily["moving_average"]),
+                    daily["counts"].tolist()
+                )
+            ],
+            "volatility": MoodAnalytics._volatility(day_index, ratings, daily, window_days),
+            "weekdays": MoodAnalytics._weekday_pattern(days, ratings),
+            "emotions": MoodAnalytics._emotions(tags, ratings),
+            "streaks": MoodAnalytics._streaks(daily)
+        }
+    
+    @staticmethod
+    def _daily_series(day_index: np.ndarray, ratings: np.ndarray, span: int, window_days: int) -> Dict[str, np.ndarray]:
+        """Per-day averages and a trailing moving average weighted by entries"""
+        counts = np.bincount(day_index, minlength=span)
+        sums = np.bincount(day_index, weights=ratings, minlength=span)
+        
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average = sums / counts
+            
+            # Trailing window sums via cumulative sums
+            sum_cumulative = np.concatenate(([0.0], np.cumsum(sums)))
+            count_cumulative = np.concatenate(([0], np.cumsum(counts)))
+            start = np.maximum(np.arange(1, span + 1) - window_days, 0)
+            window_counts = count_cumulative[1:] - count_cumulative[start]
+            moving_average = (sum_cumulative[1:] - sum_cumulative[start]) / window_counts
+        
+        return {"counts": counts, "average": average, "moving_average": moving_average}
+    
+    @staticmethod
+    def _trend_per_week(day_index: np.ndarray, ratings: np.ndarray) -> Optional[float]:
+        """Least-squares slope of rating over time, in points per week"""
+        if len(ratings) < 2 or day_index[-1] == day_index[0]:
+            return None
+        slope = np.polyfit(day_index.astype(np.float64), ratings, 1)[0]
+        return _round(slope * 7, 3)
+    
+    @staticmethod
+    def _volatility(day_index: np.ndarray, ratings: np.ndarray, daily: Dict[str, np.ndarray], window_days: int) -> dict:
+        logged_days = np.flatnonzero(daily["counts"])
+        daily_averages = daily["average"][logged_days]
+        recent = ratings[day_index > day_index[-1] - window_days]
+        
+        return {
+            "std": _round(ratings.std()),
+            "recent_std": _round(recent.std()),
+            "mean_abs_daily_change": _round(
+                np.abs(np.diff(daily_averages)).mean() if len(daily_averages) > 1 else np.nan
+            ),
+            "range": [int(ratings.min()), int(ratings.max())]
+        }
+    
+    @staticmethod
+    def _weekday_pattern(days: np.ndarray, ratings: np.ndarray) -> dict:
+        # 1970-01-01 was a Thursday (weekday 3)
+        weekday = (days.astype(np.int64) + 3) % 7
+        counts = np.bincount(weekday, minlength=7)
+        sums = np.bincount(weekday, weights=ratings, minlength=7)
+        
+        with np.errstate(invalid="ignore", divide="ignore"):
+            average = sums / counts
+        
+        pattern = {
+            WEEKDAYS[i]: {"average": _round(average[i]), "entries": int(counts[i])}
+            for i in range(7)
+        }
+        
+        logged = np.flatnonzero(counts)
+        best = logged[np.argmax(average[logged])]
+        worst = logged[np.argmin(average[logged])]
+        
+        return {
+            "by_day": pattern,
+            "best_day": WEEKDAYS[best],
+            "worst_day": WEEKDAYS[worst]
+        }
+    
+    @staticmethod
+    def _emotions(tags: List[List[str]], ratings: np.ndarray) -> dict:
+        """Tag frequencies, average mood per tag and most common tag pairs"""
+        flat = [tag for entry_tags in tags for tag in entry_tags]
+        if not flat:
+            return {"top": [], "pairs": []}
+        
+        # Normalize each distinct raw tag once, not every occurrence
+        raw_tags, raw_index = np.unique(np.array(flat, dtype=object).astype(str), return_inverse=True)
+        normalized = [tag.strip().lower() for tag in raw_tags.tolist()]
+        vocabulary = sorted(set(normalized) - {""})
+        if not vocabulary:
+            return {"top": [], "pairs": []}
+        
+        index = {tag: i for i, tag in enumerate(vocabulary)}
+        column_of_raw = np.array([index.get(tag, -1) for tag in normalized], dtype=np.int64)
+        rows = np.repeat(np.arange(len(tags)), [len(entry_tags) for entry_tags in tags])
+        columns = column_of_raw[raw_index]
+        keep = columns >= 0
+        
+        # Bound the matrices: keep the most frequent tags only
+        if len(vocabulary) > MAX_MATRIX_TAGS:
+            frequency = np.bincount(columns[keep], minlength=len(vocabulary))
+            kept = np.sort(np.argsort(-frequency, kind="stable")[:MAX_MATRIX_TAGS])
+            remap = np.full(len(vocabulary), -1, dtype=np.int64)
+            remap[kept] = np.arange(len(kept))
+            vocabulary = [vocabulary[i] for i in kept]
+            columns = np.where(keep, remap[np.maximum(columns, 0)], -1)
+            keep = columns >= 0
+        
+        # Entry x tag incidence matrix; M.T @ M counts co-occurrences
+        matrix = np.zeros((len(tags), len(vocabulary)), dtype=np.float64)
+        matrix[rows[keep], columns[keep]] = 1.0
+        counts = matrix.sum(axis=0)
+        average_rating = (matrix.T @ ratings) / counts
+        co_occurrence = matrix.T @ matrix
+        
+        top = np.argsort(-counts, kind="stable")[:MAX_EMOTIONS]
+        
+        upper_i, upper_j = np.triu_indices(len(vocabulary), k=1)
+        pair_counts = co_occurrence[upper_i, upper_j]
+        pair_order = np.argsort(-pair_counts, kind="stable")[:MAX_EMOTION_PAIRS]
+        pair_order = pair_order[pair_counts[pair_order] > 0]
+        
+        return {
+            "top": [
+                {
+                    "emotion": vocabulary[i],
+                    "count": int(counts[i]),
+                    "average_mood": _round(average_rating[i])
+                }
+                for i in top
+            ],
+            "pairs": [
+                {
+                    "emotions": [vocabulary[upper_i[k]], vocabulary[upper_j[k]]],
+                    "count": int(pair_counts[k])
+                }
+                for k in pair_order
+            ]
+        }
+    
+    @staticmethod
+    def _streaks(daily: Dict[str, np.ndarray]) -> dict:
+        logged = daily["counts"] > 0
+        with np.errstate(invalid="ignore"):
+            good = daily["average"] >= GOOD_MOOD_THRESHOLD
+            low = daily["average"] <= LOW_MOOD_THRESHOLD
+        
+        def summarize(mask: np.ndarray) -> dict:
+            runs = _runs(mask)
+            return {
+                "current": int(runs[-1]) if mask[-1] else 0,
+                "longest": int(runs.max()) if len(runs) else 0
+            }
+        
+        return {
+            "logging": summarize(logged),
+            "good_mood": summarize(good),
+            "low_mood": summarize(low)
+        }
+    
+    @staticmethod
+    def build_summary_prompt(trends: dict) -> str:
+        """
+        Prompt for a short narrative over precomputed numbers only
+        
+        No journal text is included, so the prompt size does not grow
+        with the length of the history.
+        """
+        facts = {
+            "entries": trends["entries"],
+            "period": [trends["first_day"], trends["last_day"]],
+            "overall": trends["overall"],
+            "last_7_days": [
+                {"date": day["date"], "average": day["average"]} for day in trends["daily"][-7:]
+            ],
+            "volatility": trends["volatility"],
+            "best_day": trends["weekdays"]["best_day"],
+            "worst_day": trends["weekdays"]["worst_day"],
+            "top_emotions": trends["emotions"]["top"][:5],
+            "streaks": trends["streaks"]
+        }
+        
+        return f"""
+        Berikut statistik suasana hati pengguna (skala 1-5):
+        
+        {json.dumps(facts, ensure_ascii=False)}
+        
+        Tulis ringkasan singkat (3-4 kalimat) yang hangat dan suportif tentang
+        pola yang terlihat, lalu satu saran praktis. Jangan mendiagnosis.
+        """
+
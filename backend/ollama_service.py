@@ -3,13 +3,16 @@ Ollama Service Integration
 Handles LLM interactions with Ollama
 """
 import os
-import httpx
 from typing import List, Dict, Optional
+from startup_report import lazy_import
+
+httpx = lazy_import("httpx")
 
 class OllamaService:
     def __init__(self, base_url: str = None):
         self.base_url = base_url or os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
         self.model = os.getenv("OLLAMA_MODEL", "llama2")
+        self.embed_model = os.getenv("OLLAMA_EMBED_MODEL", "nomic-embed-text")
         
     async def check_health(self) -> bool:
         """Check if Ollama service is available"""
@@ -125,6 +128,41 @@ class OllamaService:
                 "message": {}
             }
 
+    async def embed(self, text: str) -> Dict:
+        """
+        Embed text with the embedding model
+        
+        Args:
+            text: Text to embed
+        
+        Returns:
+            Dict with 'embedding' (list of floats)
+        """
+        payload = {
+            "model": self.embed_model,
+            "prompt": text
+        }
+        
+        try:
+            async with httpx.AsyncClient(timeout=10.0) as client:
+                response = await client.post(
+                    f"{self.base_url}/api/embeddings",
+                    json=payload
+                )
+                
+                if response.status_code == 200:
+                    return response.json()
+                else:
+                    return {
+                        "error": f"Ollama embedding failed with status {response.status_code}",
+                        "embedding": []
+                    }
+        except Exception as e:
+            return {
+                "error": f"Ollama embedding failed: {str(e)}",
+                "embedding": []
+            }
+
 # Mental health system prompt
 MENTAL_HEALTH_SYSTEM_PROMPT = """
 Kamu adalah asisten AI untuk konseling kesehatan mental bernama LENTERA.
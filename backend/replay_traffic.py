@@ -0,0 +1,478 @@
+"""
+Replay recorded traffic against a running server
+Plays a traffic_recorder.py log back with synthetic payloads of the same
+size and shape, keeping the original arrival pattern, and reports latency
+percentiles per endpoint next to the recorded ones
+
+Run:
+    python replay_traffic.py traffic.jsonl.1 traffic.jsonl --speed 10
+    python replay_traffic.py traffic.jsonl --speed max --concurrency 32 --output report.json
+"""
+import io
+import json
+import time
+import wave
+import asyncio
+import argparse
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import httpx
+import websockets
+
+# Requests that need ids from an earlier response cannot be replayed
+SKIPPED_ENDPOINT_MARKER = "{id}"
+
+# Filler text for synthetic messages
+FILLER_WORDS = "saya merasa hari ini cukup berat tapi saya mencoba tetap tenang dan bernapas".split()
+
+# Multipart boundaries and form headers around an uploaded file
+MULTIPART_OVERHEAD_BYTES = 200
+
+SAMPLE_RATE = 16000
+
+# A voice turn ends with one of these server messages
+TURN_END_TYPES = {"voice_response", "no_speech", "error"}
+
+# Synthetic audio: "speech" passes the server's speech pre-filter and is
+# transcribed; "noise" is rejected by it (exercises the no_speech path)
+AUDIO_KINDS = ("speech", "noise")
+
+
+def synthetic_text(length: int) -> str:
+    """Indonesian-looking filler text of exactly length characters"""
+    words = []
+    size = 0
+    i = 0
+    while size < length:
+        word = FILLER_WORDS[i % len(FILLER_WORDS)]
+        words.append(word)
+        size += len(word) + 1
+        i += 1
+    return " ".join(words)[:length]
+
+
+def synthetic_value(shape: Any) -> Any:
+    """Rebuild a JSON value from its recorded shape"""
+    if isinstance(shape, dict):
+        if set(shape) == {"s"}:
+            return synthetic_text(shape["s"])
+        return {k: synthetic_value(v) for k, v in shape.items()}
+    if isinstance(shape, list):
+        return [synthetic_value(v) for v in shape]
+    return shape
+
+
+def synthetic_wav(size: int, kind: str = "speech") -> bytes:
+    """
+    16kHz mono WAV of about size bytes
+    
+    Args:
+        size: Target size in bytes
+        kind: "speech" (voiced harmonics with a syllable-rate envelope, which
+              Silero VAD accepts) or "noise" (broadband hiss)
+    """
+    n = max(SAMPLE_RATE // 10, (size - 44) // 2)
+    t = np.arange(n) / SAMPLE_RATE
+    rng = np.random.default_rng(n)
+    
+    if kind == "noise":
+        signal = 0.05 * rng.standard_normal(n)
+    else:
+        # Gliding 120Hz pitch, harmonics with a formant-like boost, ~3 syllables/s
+        f0 = 120 + 20 * np.sin(2 * np.pi * 0.7 * t)
+        phase = 2 * np.pi * np.cumsum(f0) / SAMPLE_RATE
+        voiced = sum(np.sin(k * phase) / k * (1.5 if 5 <= k <= 7 else 1.0) for k in range(1, 25))
+        envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None)
+        signal = 0.1 * voiced * envelope + 0.002 * rng.standard_normal(n)
+    signal = np.clip(signal, -1.0, 1.0)
+    
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes((signal * 32767).astype("<i2").tobytes())
+    return buffer.getvalue()
+
+
+def turn_latencies(events: List[list]) -> List[float]:
+    """
+    Latency of each answered voice turn in a WebSocket event list
+    
+    A turn starts with a complete binary utterance or audio_end and ends
+    with the next voice_response or error; a new turn before that
+    (barge-in) drops the pending one.
+    """
+    latencies = []
+    streaming = False
+    pending: Optional[float] = None
+    
+    for event in events:
+        offset, direction, kind = event[0], event[1], event[2]
+        if direction == "in":
+            if kind == "audio_start":
+                streaming, pending = True, None
+            elif kind == "audio_end":
+                streaming, pending = False, offset
+            elif kind == "bytes" and not streaming:
+                pending = offset
+            elif kind == "stop":
+                pending = None
+        elif kind in TURN_END_TYPES and pending is not None:
+            latencies.append(float(offset - pending))
+            pending = None
+    
+    return latencies
+
+
+def load_recording(paths: List[str]) -> List[dict]:
+    """Read entries from one or more (rotated) logs, in start order"""
+    entries = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            entries.extend(json.loads(line) for line in f if line.strip())
+    entries.sort(key=lambda entry: entry["t"])
+    return entries
+
+
+def entry_label(entry: dict) -> str:
+    if entry["kind"] == "ws":
+        return f"WS {entry['endpoint']} turn"
+    return f"{entry['method']} {entry['endpoint']}"
+
+
+class Replayer:
+    """Replays entries and collects latencies per endpoint"""
+    
+    def __init__(
+        self,
+        base_url: str,
+        speed: Optional[float],
+        concurrency: int,
+        timeout: float,
+        audio: str = "speech"
+    ):
+        """
+        Initialize replayer
+        
+        Args:
+            base_url: Server under test (http://host:port)
+            speed: Time compression factor, None for max speed
+            concurrency: Requests in flight at once at max speed
+            timeout: Per-request timeout in seconds
+            audio: Synthetic audio kind (see AUDIO_KINDS)
+        """
+        self.base_url = base_url.rstrip("/")
+        self.ws_url = "ws" + self.base_url[len("http"):]
+        self.speed = speed
+        self.timeout = timeout
+        self.audio = audio
+        self._slots = asyncio.Semaphore(concurrency) if speed is None else None
+        self._client = httpx.AsyncClient(base_url=self.base_url, timeout=timeout)
+        
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.statuses: Dict[str, Dict[int, int]] = defaultdict(lambda: defaultdict(int))
+        self.skipped = 0
+    
+    async def run(self, entries: List[dict]) -> float:
+        """Replay all entries; returns wall time in seconds"""
+        started = time.perf_counter()
+        first = entries[0]["t"] if entries else 0.0
+        tasks = []
+        
+        for entry in entries:
+            if SKIPPED_ENDPOINT_MARKER in entry["endpoint"]:
+                self.skipped += 1
+                continue
+            if self.speed is not None:
+                delay = (entry["t"] - first) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self._replay(entry)))
+        
+        await asyncio.gather(*tasks)
+        await self._client.aclose()
+        return time.perf_counter() - started
+    
+    async def _replay(self, entry: dict):
+        if self._slots is None:
+            await self._replay_entry(entry)
+            return
+        async with self._slots:
+            await self._replay_entry(entry)
+    
+    async def _replay_entry(self, entry: dict):
+        label = entry_label(entry)
+        try:
+            if entry["kind"] == "ws":
+                await self._replay_websocket(entry, label)
+            else:
+                await self._replay_http(entry, label)
+        except Exception:
+            self.errors[label] += 1
+    
+    async def _replay_http(self, entry: dict, label: str):
+        kwargs = {"params": synthetic_value(entry.get("query") or {})}
+        if entry.get("upload") == "multipart":
+            audio = synthetic_wav(entry["req_bytes"] - MULTIPART_OVERHEAD_BYTES, self.audio)
+            kwargs["files"] = {"audio": ("replay.wav", audio, "audio/wav")}
+        elif "body" in entry:
+            kwargs["json"] = synthetic_value(entry["body"])
+        
+        started = time.perf_counter()
+        response = await self._client.request(entry["method"], entry["endpoint"], **kwargs)
+        elapsed = (time.perf_counter() - started) * 1000
+        
+        self.statuses[label][response.status_code] += 1
+        if response.status_code >= 500:
+            self.errors[label] += 1
+        else:
+            self.latencies[label].append(elapsed)
+    
+    async def _replay_websocket(self, entry: dict, label: str):
+        """
+        Replay one voice call session
+        
+        Where the recorded client waited for a reply before speaking again,
+        the replay waits for the server's reply too and then keeps the
+        recorded (scaled) think time, so faster speeds do not turn normal
+        turns into barge-ins.
+        """
+        query = synthetic_value(entry.get("query") or {})
+        url = f"{self.ws_url}{entry['endpoint']}"
+        if query:
+            url += "?" + str(httpx.QueryParams(query))
+        
+        schedule = self._websocket_schedule(entry["events"])
+        payloads = self._websocket_payloads([event for event, _, _ in schedule], self.audio)
+        speed = self.speed or float("inf")
+        
+        async with websockets.connect(url, max_size=None, open_timeout=self.timeout) as ws:
+            pending: List[Optional[float]] = [None]
+            answered_at: List[float] = [time.perf_counter()]
+            answered = asyncio.Event()
+            
+            async def read_replies():
+                async for message in ws:
+                    if isinstance(message, bytes):
+                        continue
+                    kind = json.loads(message).get("type")
+                    if kind in TURN_END_TYPES and pending[0] is not None:
+                        self.latencies[label].append((time.perf_counter() - pending[0]) * 1000)
+                        if kind == "error":
+                            self.errors[label] += 1
+                        pending[0] = None
+                        answered_at[0] = time.perf_counter()
+                        answered.set()
+            
+            reader = asyncio.create_task(read_replies())
+            streaming = False
+            sent_at = time.perf_counter()
+            try:
+                for (event, after_reply, gap_ms), payload in zip(schedule, payloads):
+                    anchor = sent_at
+                    if after_reply:
+                        if pending[0] is not None:
+                            await asyncio.wait_for(answered.wait(), timeout=self.timeout)
+                        anchor = answered_at[0]
+                    
+                    delay = gap_ms / 1000 / speed - (time.perf_counter() - anchor)
+                    if delay > 0:
+                        await asyncio.sleep(delay)
+                    
+                    kind = event[2]
+                    if kind == "audio_start":
+                        streaming, pending[0] = True, None
+                    elif kind == "audio_end":
+                        streaming, pending[0] = False, time.perf_counter()
+                    elif kind == "bytes" and not streaming:
+                        pending[0] = time.perf_counter()
+                    elif kind == "stop":
+                        pending[0] = None
+                    answered.clear()
+                    await ws.send(payload)
+                    sent_at = time.perf_counter()
+                
+                # Let the last turn finish before hanging up
+                if pending[0] is not None:
+                    await asyncio.wait_for(answered.wait(), timeout=self.timeout)
+            finally:
+                reader.cancel()
+    
+    @staticmethod
+    def _websocket_schedule(events: List[list]) -> List[Tuple[list, bool, float]]:
+        """
+        Inbound events with their timing
+        
+        Returns:
+            List of (event, after_reply, gap_ms): after_reply is True when a
+            turn reply arrived since the previous inbound event, and gap_ms is
+            measured from that reply, otherwise from the previous inbound event
+        """
+        schedule = []
+        previous_in = 0
+        reply_at: Optional[int] = None
+        
+        for event in events:
+            if event[1] == "out":
+                if event[2] in TURN_END_TYPES:
+                    reply_at = event[0]
+                continue
+            
+            if reply_at is not None:
+                schedule.append((event, True, event[0] - reply_at))
+            else:
+                schedule.append((event, False, event[0] - previous_in))
+            previous_in = event[0]
+            reply_at = None
+        
+        return schedule
+    
+    @staticmethod
+    def _websocket_payloads(inbound: List[list], audio_kind: str = "speech") -> List[Any]:
+        """
+        Synthetic messages for the inbound events
+        
+        Streamed utterances get one WAV of the total size, cut into the
+        recorded chunk sizes, so the server sees a decodable stream.
+        """
+        payloads: List[Any] = [None] * len(inbound)
+        chunk_indexes: Optional[List[int]] = None
+        
+        for i, event in enumerate(inbound):
+            kind, size = event[2], event[3]
+            fields = event[4] if len(event) > 4 else {}
+            
+            if kind == "bytes":
+                if chunk_indexes is None:
+                    payloads[i] = synthetic_wav(size, audio_kind)
+                else:
+                    chunk_indexes.append(i)
+                continue
+            
+            if kind == "audio_start":
+                chunk_indexes = []
+            elif kind == "audio_end" and chunk_indexes is not None:
+                sizes = [inbound[j][3] for j in chunk_indexes]
+                audio = synthetic_wav(sum(sizes), audio_kind)
+                position = 0
+                for j, chunk_size in zip(chunk_indexes, sizes):
+                    payloads[j] = audio[position:position + chunk_size]
+                    position += chunk_size
+                if chunk_indexes:
+                    # Synthetic WAV may be a few bytes longer than recorded
+                    payloads[chunk_indexes[-1]] += audio[position:]
+                chunk_indexes = None
+            
+            message = {"type": kind} if kind != "text" else {}
+            message.update(synthetic_value(fields))
+            payloads[i] = json.dumps(message)
+        
+        # Utterance still open when the recording ended
+        for j in chunk_indexes or []:
+            payloads[j] = synthetic_wav(inbound[j][3], audio_kind)
+        
+        return payloads
+
+
+def percentiles(values: List[float]) -> Tuple[float, float, float, float]:
+    if not values:
+        return (0.0, 0.0, 0.0, 0.0)
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return (float(p50), float(p90), float(p99), float(max(values)))
+
+
+def recorded_latencies(entries: List[dict]) -> Dict[str, List[float]]:
+    """Latencies observed when the traffic was recorded"""
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    for entry in entries:
+        label = entry_label(entry)
+        if entry["kind"] == "ws":
+            latencies[label].extend(turn_latencies(entry["events"]))
+        elif entry.get("status") and entry["status"] < 500:
+            latencies[label].append(entry["ms"])
+    return latencies
+
+
+def build_report(replayer: Replayer, entries: List[dict], wall_seconds: float) -> dict:
+    recorded = recorded_latencies(entries)
+    endpoints = {}
+    
+    for label in sorted(set(replayer.latencies) | set(replayer.errors)):
+        p50, p90, p99, worst = percentiles(replayer.latencies[label])
+        rec_p50, _, rec_p99, _ = percentiles(recorded.get(label, []))
+        endpoints[label] = {
+            "count": len(replayer.latencies[label]),
+            "errors": replayer.errors[label],
+            "statuses": dict(replayer.statuses.get(label, {})),
+            "p50_ms": round(p50, 1),
+            "p90_ms": round(p90, 1),
+            "p99_ms": round(p99, 1),
+            "max_ms": round(worst, 1),
+            "recorded_p50_ms": round(rec_p50, 1),
+            "recorded_p99_ms": round(rec_p99, 1)
+        }
+    
+    span = entries[-1]["t"] - entries[0]["t"] if entries else 0.0
+    return {
+        "entries": len(entries),
+        "skipped": replayer.skipped,
+        "recorded_seconds": round(span, 1),
+        "wall_seconds": round(wall_seconds, 1),
+        "endpoints": endpoints
+    }
+
+
+def print_report(report: dict):
+    print(
+        f"Replayed {report['entries'] - report['skipped']} of {report['entries']} entries "
+        f"({report['recorded_seconds']}s recorded) in {report['wall_seconds']}s"
+    )
+    header = f"{'endpoint':<32} {'count':>6} {'err':>4} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8} {'rec p50':>8} {'rec p99':>8}"
+    print(header)
+    print("-" * len(header))
+    for label, stats in report["endpoints"].items():
+        print(
+            f"{label:<32} {stats['count']:>6} {stats['errors']:>4} "
+            f"{stats['p50_ms']:>8} {stats['p90_ms']:>8} {stats['p99_ms']:>8} {stats['max_ms']:>8} "
+            f"{stats['recorded_p50_ms']:>8} {stats['recorded_p99_ms']:>8}"
+        )
+
+
+def parse_speed(value: str) -> Optional[float]:
+    if value == "max":
+        return None
+    speed = float(value.rstrip("x"))
+    if speed <= 0:
+        raise argparse.ArgumentTypeError("speed must be positive or 'max'")
+    return speed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded LENTERA traffic")
+    parser.add_argument("recordings", nargs="+", help="Traffic logs (rotated files may be listed together)")
+    parser.add_argument("--base-url", default="http://localhost:8000", help="Server under test")
+    parser.add_argument("--speed", type=parse_speed, default=1.0, help="1, 10 (times faster) or max")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at max speed")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--audio", choices=AUDIO_KINDS, default="speech",
+                        help="Synthetic audio: speech is transcribed, noise is rejected by the speech filter")
+    parser.add_argument("--output", help="Also write the report as JSON")
+    args = parser.parse_args()
+    
+    entries = load_recording(args.recordings)
+    replayer = Replayer(args.base_url, args.speed, args.concurrency, args.timeout, args.audio)
+    wall_seconds = asyncio.run(replayer.run(entries))
+    
+    report = build_report(replayer, entries, wall_seconds)
+    print_report(report)
+    
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
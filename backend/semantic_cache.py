@@ -0,0 +1,334 @@
+"""
+Semantic response cache for /api/chat
+Many chat messages are paraphrases of common questions (anxiety, sleep,
+stress tips). Messages are embedded through Ollama and compared against
+earlier answered messages; close enough matches reuse the stored answer
+instead of generating a new one.
+"""
+from __future__ import annotations
+import os
+import time
+import logging
+from typing import Dict, List, Optional, Set, Tuple
+
+from startup_report import lazy_import
+from ollama_service import OllamaService
+from logging_setup import sampled
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_message(text: str) -> str:
+    """Lowercase and collapse whitespace, so trivially equal messages share a key"""
+    return " ".join(text.lower().split())
+
+
+class SemanticCache:
+    """
+    Bounded cache of chat answers keyed by message embeddings
+    Embeddings are stored L2-normalized as rows of one matrix, so a lookup
+    is a single matrix-vector product (cosine similarity) over all entries.
+    Full cache: the least recently used entry is replaced.
+    
+    An answer is only stored once similar messages came from min_users
+    different users: a question several people ask is generic, while an
+    answer to one user may be about their situation. Until then the askers
+    are tracked per message cluster, without the answers.
+    """
+    
+    def __init__(
+        self,
+        ollama_service: OllamaService,
+        max_entries: int = 0,
+        ttl_seconds: float = 86400.0,
+        threshold: float = 0.92,
+        max_chars: int = 200,
+        min_users: int = 2
+    ):
+        """
+        Initialize semantic cache
+        
+        Args:
+            ollama_service: Service used for embeddings
+            max_entries: Maximum number of cached answers (0 disables)
+            ttl_seconds: Time-to-live of each entry in seconds
+            threshold: Minimum cosine similarity for a hit
+            max_chars: Longer messages are not cached; they tend to be
+                       personal and answers may refer to their details
+            min_users: Distinct users that must ask before an answer is
+                       stored (anonymous requests do not count)
+        """
+        self.ollama_service = ollama_service
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.max_chars = max_chars
+        self.min_users = max(1, min_users)
+        
+        # Allocated on first put, once the embedding size is known
+        self._vectors: Optional[np.ndarray] = None
+        self._stored_at: Optional[np.ndarray] = None
+        self._last_used: Optional[np.ndarray] = None
+        self._answers: List[Optional[str]] = [None] * max_entries
+        self._keys: List[Optional[str]] = [None] * max_entries
+        
+        # Message clusters not asked by enough users yet: embedding and askers
+        self._pending_vectors: Optional[np.ndarray] = None
+        self._pending_at: Optional[np.ndarray] = None
+        self._pending_users: List[Optional[Set[str]]] = [None] * max_entries
+        
+        # Normalized message -> slot: exact repeats skip the embedding call
+        self._slots: Dict[str, int] = {}
+        
+        self.stats = {
+            "hits": 0,
+            "exact_hits": 0,
+            "misses": 0,
+            "skipped": 0,
+            "evictions": 0,
+            "held_back": 0,
+            "expirations": 0,
+            "embedding_errors": 0
+        }
+        
+        if self.enabled:
+            logger.info(
+                f"SemanticCache configured: max_entries={max_entries}, ttl={ttl_seconds}s, "
+                f"threshold={threshold}, min_users={self.min_users}, model={ollama_service.embed_model}"
+            )
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+    
+    def is_cacheable(self, text: str) -> bool:
+        """Short single messages only (crisis messages never reach the cache)"""
+        return self.enabled and 0 < len(text.strip()) <= self.max_chars
+    
+    async def lookup(
+        self,
+        text: str,
+        user_id: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[np.ndarray]]:
+        """
+        Find a cached answer for a message
+        
+        Args:
+            text: User message
+            user_id: Asker (None: anonymous)
+        
+        Returns:
+            Tuple of (cached answer or None, embedding to pass to put() on
+            a miss; None if the message is not cacheable)
+        """
+        if not self.is_cacheable(text):
+            self.stats["skipped"] += 1
+            return None, None
+        
+        key = normalize_message(text)
+        now = time.monotonic()
+        
+        slot = self._slots.get(key)
+        if slot is not None and self._is_live(slot, now):
+            self.stats["exact_hits"] += 1
+            return self._hit(slot, now), None
+        
+        if user_id is None and self.min_users > 1 and not self._has_live_entries(now):
+            # Nothing to hit and an anonymous answer is never stored:
+            # skip the embedding round trip
+            self.stats["skipped"] += 1
+            return None, None
+        
+        vector = await self._embed(key)
+        if vector is None:
+            return None, None
+        
+        if self._vectors is not None and self._vectors.shape[1] == len(vector):
+            live = now - self._stored_at <= self.ttl_seconds
+            if live.any():
+                similarity = self._vectors @ vector
+                similarity[~live] = -np.inf
+                best = int(np.argmax(similarity))
+                if similarity[best] >= self.threshold:
+                    logger.info("Semantic cache hit", extra=sampled(similarity=round(float(similarity[best]), 3)))
+                    return self._hit(best, now), vector
+        
+        self.stats["misses"] += 1
+        return None, vector
+    
+    def put(
+        self,
+        text: str,
+        vector: Optional[np.ndarray],
+        answer: str,
+        user_id: Optional[str] = None
+    ):
+        """
+        Store an answer once enough different users asked a similar message
+        
+        Args:
+            text: User message
+            vector: Embedding returned by lookup() (None: nothing stored)
+            answer: Generated answer
+            user_id: Asker (None: anonymous, never counts towards min_users)
+        """
+        if vector is None or not answer:
+            return
+        
+        if self._vectors is None or self._vectors.shape[1] != len(vector):
+            # First entry, or the embedding model changed
+            self._allocate(len(vector))
+        
+        if not self._asked_by_enough_users(vector, user_id, time.monotonic()):
+            self.stats["held_back"] += 1
+            return
+        
+        slot = self._free_slot(time.monotonic())
+        old_key = self._keys[slot]
+        if old_key is not None and self._slots.get(old_key) == slot:
+            del self._slots[old_key]
+        
+        key = normalize_message(text)
+        now = time.monotonic()
+        self._vectors[slot] = vector
+        self._stored_at[slot] = now
+        self._last_used[slot] = now
+        self._answers[slot] = answer
+        self._keys[slot] = key
+        self._slots[key] = slot
+    
+    def clear(self):
+        """Remove all entries"""
+        self._vectors = None
+        self._stored_at = None
+        self._last_used = None
+        self._answers = [None] * self.max_entries
+        self._keys = [None] * self.max_entries
+        self._pending_vectors = None
+        self._pending_at = None
+        self._pending_users = [None] * self.max_entries
+        self._slots.clear()
+    
+    async def _embed(self, key: str) -> Optional[np.ndarray]:
+        """Normalized embedding, or None if the embedding request failed"""
+        response = await self.ollama_service.embed(key)
+        embedding = response.get("embedding")
+        if "error" in response or not embedding:
+            self.stats["embedding_errors"] += 1
+            logger.warning(f"Semantic cache embedding failed: {response.get('error', 'empty embedding')}")
+            return None
+        
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+    
+    def _allocate(self, dimensions: int):
+        self.clear()
+        self._vectors = np.zeros((self.max_entries, dimensions), dtype=np.float32)
+        self._stored_at = np.full(self.max_entries, -np.inf)
+        self._last_used = np.full(self.max_entries, -np.inf)
+        self._pending_vectors = np.zeros((self.max_entries, dimensions), dtype=np.float32)
+        self._pending_at = np.full(self.max_entries, -np.inf)
+    
+    def _asked_by_enough_users(self, vector: np.ndarray, user_id: Optional[str], now: float) -> bool:
+        """Count the asker in the message's cluster; True once it has min_users askers"""
+        if self.min_users <= 1:
+            return True
+        if user_id is None:
+            return False
+        
+        live = now - self._pending_at <= self.ttl_seconds
+        similarity = self._pending_vectors @ vector
+        similarity[~live] = -np.inf
+        best = int(np.argmax(similarity))
+        
+        if similarity[best] >= self.threshold:
+            users = self._pending_users[best]
+            users.add(user_id)
+            if len(users) < self.min_users:
+                return False
+            # Cluster graduates to a cached answer
+            self._pending_at[best] = -np.inf
+            self._pending_users[best] = None
+            return True
+        
+        # New cluster: replace the oldest one
+        slot = int(np.argmin(self._pending_at))
+        self._pending_vectors[slot] = vector
+        self._pending_at[slot] = now
+        self._pending_users[slot] = {user_id}
+        return False
+    
+    def _has_live_entries(self, now: float) -> bool:
+        return self._stored_at is not None and bool((now - self._stored_at <= self.ttl_seconds).any())
+    
+    def _is_live(self, slot: int, now: float) -> bool:
+        if now - self._stored_at[slot] <= self.ttl_seconds:
+            return True
+        self.stats["expirations"] += 1
+        del self._slots[self._keys[slot]]
+        self._stored_at[slot] = -np.inf
+        self._answers[slot] = None
+        self._keys[slot] = None
+        return False
+    
+    def _hit(self, slot: int, now: float) -> str:
+        self.stats["hits"] += 1
+        self._last_used[slot] = now
+        return self._answers[slot]
+    
+    def _free_slot(self, now: float) -> int:
+        """Empty or expired slot, else the least recently used one"""
+        expired = np.flatnonzero(now - self._stored_at > self.ttl_seconds)
+        if len(expired):
+            slot = int(expired[0])
+            if self._answers[slot] is not None:
+                self.stats["expirations"] += 1
+            return slot
+        
+        self.stats["evictions"] += 1
+        return int(np.argmin(self._last_used))
+    
+    def get_stats(self) -> dict:
+        """Get cache statistics"""
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            "entries": (
+                int((time.monotonic() - self._stored_at <= self.ttl_seconds).sum())
+                if self._stored_at is not None else 0
+            ),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "threshold": self.threshold,
+            **self.stats,
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0
+        }
+
+
+# Global instance (singleton)
+semantic_cache: Optional[SemanticCache] = None
+
+
+def get_semantic_cache(ollama_service: OllamaService) -> SemanticCache:
+    """Get or create semantic cache instance"""
+    global semantic_cache
+    
+    if semantic_cache is None:
+        max_entries = int(os.getenv("SEMANTIC_CACHE_SIZE", "0"))
+        ttl_seconds = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+        threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+        max_chars = int(os.getenv("SEMANTIC_CACHE_MAX_CHARS", "200"))
+        min_users = int(os.getenv("SEMANTIC_CACHE_MIN_USERS", "2"))
+        
+        semantic_cache = SemanticCache(
+            ollama_service,
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds,
+            threshold=threshold,
+            max_chars=max_chars,
+            min_users=min_users
+        )
+    
+    return semantic_cache
@@ -0,0 +1,193 @@
+"""
+Startup timing and lazy imports
+Heavy modules (numpy, faster_whisper, edge_tts, pydub, httpx) are bound
+with lazy_import() and only imported on first attribute access, or by the
+background preload after startup. Every import and model load is timed
+into the startup report (GET /metrics → "startup").
+
+Cold-start budget check (exits non-zero when over budget, for CI):
+    python startup_report.py --budget 3.0
+"""
+import os
+import sys
+import time
+import logging
+import importlib
+import threading
+from contextlib import contextmanager
+from types import ModuleType
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Clock starts when this module is first imported (first thing main.py does)
+PROCESS_STARTED = time.perf_counter()
+
+
+class StartupReport:
+    """Collects import and load times per component"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.components: Dict[str, Dict[str, float]] = {}
+        self.milestones: Dict[str, float] = {}
+    
+    def record(self, component: str, phase: str, seconds: float):
+        """
+        Record one timed step
+        
+        Args:
+            component: e.g. numpy, whisper, tts
+            phase: e.g. import, model_load
+            seconds: Duration
+        """
+        with self._lock:
+            self.components.setdefault(component, {})[f"{phase}_ms"] = round(seconds * 1000, 1)
+    
+    @contextmanager
+    def measure(self, component: str, phase: str):
+        """Time a block and record it"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(component, phase, time.perf_counter() - started)
+    
+    def milestone(self, name: str):
+        """Record time since process start (first call wins)"""
+        with self._lock:
+            self.milestones.setdefault(name, round((time.perf_counter() - PROCESS_STARTED) * 1000, 1))
+    
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {
+                "milestones_ms": dict(self.milestones),
+                "components": {name: dict(phases) for name, phases in self.components.items()}
+            }
+
+
+startup_report = StartupReport()
+
+
+def get_startup_report() -> StartupReport:
+    """Get the process-wide startup report"""
+    return startup_report
+
+
+class LazyModule(ModuleType):
+    """
+    Module stand-in that imports the real module on first attribute access
+    After loading, the real module's attributes are copied onto the
+    stand-in so later lookups cost the same as on the real module.
+    """
+    
+    def __init__(self, name: str, component: Optional[str] = None):
+        super().__init__(name)
+        self._lazy_component = component or name.split(".")[0]
+        self._lazy_lock = threading.Lock()
+        self._lazy_module: Optional[ModuleType] = None
+    
+    def _load(self) -> ModuleType:
+        with self._lazy_lock:
+            if self._lazy_module is None:
+                already_loaded = self.__name__ in sys.modules
+                started = time.perf_counter()
+                module = importlib.import_module(self.__name__)
+                if not already_loaded:
+                    startup_report.record(self._lazy_component, "import", time.perf_counter() - started)
+                self.__dict__.update(module.__dict__)
+                self._lazy_module = module
+        return self._lazy_module
+    
+    def __getattr__(self, attr: str):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(name: str, component: Optional[str] = None) -> ModuleType:
+    """
+    Bind a module without importing it yet
+    
+    Args:
+        name: Module name (e.g. "numpy", "faster_whisper.vad")
+        component: Name used in the startup report (default: top package)
+    
+    Returns:
+        Module stand-in; attribute access triggers the import
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    return LazyModule(name, component)
+
+
+# Imported in the background right after startup
+HEAVY_MODULES = ("numpy", "httpx", "pydub", "edge_tts", "faster_whisper")
+
+
+def preload(*modules: ModuleType):
+    """Import lazy modules now (call from a background thread)"""
+    for module in modules:
+        if isinstance(module, LazyModule):
+            try:
+                module._load()
+            except ImportError as e:
+                logger.warning(f"Preload of {module.__name__} failed: {e}")
+
+
+def preload_heavy_modules():
+    """Import HEAVY_MODULES so first requests do not pay for them"""
+    preload(*(lazy_import(name) for name in HEAVY_MODULES))
+
+
+def check_cold_start(port: int, timeout_seconds: float = 60.0) -> float:
+    """
+    Start the API in a fresh process and time the first "/" response
+    
+    Returns:
+        Seconds from process launch to the first 200 response
+    """
+    import subprocess
+    import urllib.request
+    
+    command = [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(port)]
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        command,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    
+    try:
+        while True:
+            if process.poll() is not None:
+                raise RuntimeError(f"Server exited with code {process.returncode}")
+            if time.perf_counter() - started > timeout_seconds:
+                raise RuntimeError(f"No response within {timeout_seconds}s")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/", timeout=1) as response:
+                    if response.status == 200:
+                        return time.perf_counter() - started
+            except OSError:
+                time.sleep(0.02)
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Check LENTERA API cold-start time")
+    parser.add_argument("--budget", type=float, default=float(os.getenv("COLD_START_BUDGET_SECONDS", "3.0")),
+                        help="Maximum seconds until the first / response")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the throwaway server")
+    args = parser.parse_args()
+    
+    elapsed = check_cold_start(args.port)
+    status = "OK" if elapsed <= args.budget else "OVER BUDGET"
+    print(f"Cold start to first / response: {elapsed:.2f}s (budget {args.budget:.2f}s) {status}")
+    sys.exit(0 if elapsed <= args.budget else 1)
+
+
+if __name__ == "__main__":
+    main()
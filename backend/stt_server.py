@@ -0,0 +1,201 @@
+"""
+Shared Speech-to-Text server
+Holds the Whisper model in one process and serves transcriptions to all
+uvicorn workers over a Unix socket, so the model is loaded only once
+
+Run:
+    python stt_server.py --socket /tmp/lentera-stt.sock
+    WHISPER_MODE=client WHISPER_SERVER_SOCKET=/tmp/lentera-stt.sock API_WORKERS=4 python main.py
+
+Start the workers through main.py, not "uvicorn --workers": API_WORKERS is
+what tells each worker to split its limits and disable per-process features.
+
+Framing (all integers big-endian):
+    1 byte  message type
+    4 bytes metadata length
+    4 bytes payload length
+    metadata (UTF-8 JSON), payload (raw bytes)
+
+Audio travels as raw float32 PCM (or the encoded file bytes) in the
+payload, never as JSON or base64.
+"""
+import io
+import os
+import json
+import struct
+import asyncio
+import logging
+import argparse
+from typing import Tuple
+
+from startup_report import lazy_import
+from logging_setup import configure_logging
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+# Message types
+MSG_TRANSCRIBE = 1
+MSG_RESULT = 2
+MSG_ERROR = 3
+MSG_PING = 4
+MSG_PONG = 5
+
+# Payload encodings for MSG_TRANSCRIBE
+ENCODING_PCM_F32LE = "pcm_f32le"  # 16kHz mono float32 samples
+ENCODING_FILE = "file"  # encoded audio file bytes (wav, webm, ...)
+ENCODING_PATH = "path"  # no payload; metadata carries a local file path
+
+HEADER = struct.Struct("!BII")
+
+# Upper bound on a frame (5 minutes of float32 PCM is ~19 MB)
+MAX_FRAME_BYTES = 64 * 1024 * 1024
+
+DEFAULT_SOCKET_PATH = "/tmp/lentera-stt.sock"
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Tuple[int, dict, bytes]:
+    """
+    Read one frame
+    
+    Returns:
+        Tuple of (message_type, metadata, payload)
+    """
+    header = await reader.readexactly(HEADER.size)
+    message_type, meta_length, payload_length = HEADER.unpack(header)
+    
+    if meta_length + payload_length > MAX_FRAME_BYTES:
+        raise ValueError(f"Frame too large: {meta_length + payload_length} bytes")
+    
+    meta = json.loads(await reader.readexactly(meta_length)) if meta_length else {}
+    payload = await reader.readexactly(payload_length) if payload_length else b""
+    return message_type, meta, payload
+
+
+async def write_frame(
+    writer: asyncio.StreamWriter,
+    message_type: int,
+    meta: dict,
+    payload=b""
+):
+    """
+    Write one frame
+    
+    Args:
+        writer: Stream writer
+        message_type: One of the MSG_* constants
+        meta: JSON-serializable metadata
+        payload: bytes-like payload (memoryviews are written without copying)
+    """
+    meta_bytes = json.dumps(meta).encode("utf-8") if meta else b""
+    payload_length = memoryview(payload).nbytes
+    
+    writer.write(HEADER.pack(message_type, len(meta_bytes), payload_length))
+    if meta_bytes:
+        writer.write(meta_bytes)
+    if payload_length:
+        writer.write(payload)
+    await writer.drain()
+
+
+class STTServer:
+    """Serves transcription requests from web workers"""
+    
+    def __init__(self, whisper_service, socket_path: str = DEFAULT_SOCKET_PATH):
+        """
+        Initialize STT server
+        
+        Args:
+            whisper_service: WhisperService in local mode (owns the model)
+            socket_path: Unix socket path to listen on
+        """
+        self.whisper_service = whisper_service
+        self.socket_path = socket_path
+        self.requests = 0
+    
+    async def serve(self):
+        """Load the model and serve until cancelled"""
+        await self.whisper_service.initialize()
+        
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        
+        server = await asyncio.start_unix_server(self._handle_connection, path=self.socket_path)
+        logger.info(f"STT server listening on {self.socket_path}")
+        
+        async with server:
+            await server.serve_forever()
+    
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve requests on one connection until the client closes it"""
+        try:
+            while True:
+                try:
+                    message_type, meta, payload = await read_frame(reader)
+                except asyncio.IncompleteReadError:
+                    break
+                
+                if message_type == MSG_PING:
+                    await write_frame(writer, MSG_PONG, self.whisper_service.get_info())
+                elif message_type == MSG_TRANSCRIBE:
+                    await self._handle_transcribe(writer, meta, payload)
+                else:
+                    await write_frame(writer, MSG_ERROR, {"error": f"Unknown message type {message_type}"})
+        
+        except Exception as e:
+            logger.error(f"STT connection error: {e}")
+        finally:
+            writer.close()
+    
+    async def _handle_transcribe(self, writer: asyncio.StreamWriter, meta: dict, payload: bytes):
+        """Transcribe one request and send the segments back"""
+        self.requests += 1
+        encoding = meta.get("encoding", ENCODING_PCM_F32LE)
+        
+        try:
+            if encoding == ENCODING_PCM_F32LE:
+                # Zero-copy view over the received payload
+                audio = np.frombuffer(payload, dtype="<f4")
+            elif encoding == ENCODING_FILE:
+                audio = io.BytesIO(payload)
+            elif encoding == ENCODING_PATH:
+                audio = meta["path"]
+            else:
+                raise ValueError(f"Unknown encoding: {encoding}")
+            
+            segments, confidence = await self.whisper_service.run_transcription(
+                audio,
+                meta.get("language") or self.whisper_service.language
+            )
+            await write_frame(writer, MSG_RESULT, {"segments": segments, "confidence": confidence})
+        
+        except Exception as e:
+            logger.error(f"STT request failed: {e}")
+            await write_frame(writer, MSG_ERROR, {"error": str(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LENTERA shared STT server")
+    parser.add_argument(
+        "--socket",
+        default=os.getenv("WHISPER_SERVER_SOCKET", DEFAULT_SOCKET_PATH),
+        help="Unix socket path to listen on"
+    )
+    args = parser.parse_args()
+    
+    configure_logging()
+    
+    from whisper_service import get_whisper_service
+    
+    # This process owns the model, whatever WHISPER_MODE the workers use
+    server = STTServer(get_whisper_service(mode="local"), socket_path=args.socket)
+    
+    try:
+        asyncio.run(server.serve())
+    except KeyboardInterrupt:
+        logger.info("STT server stopped")
+
+
+if __name__ == "__main__":
+    main()
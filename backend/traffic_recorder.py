@@ -0,0 +1,297 @@
+"""
+Traffic recorder for performance regression testing
+Captures the timing and shape of API and voice call traffic (never user
+text or audio) to an append-only JSON lines log with rotation, to be
+played back with replay_traffic.py
+
+Enable with TRAFFIC_RECORD_PATH. Each line is one HTTP request or one
+WebSocket session:
+    {"t": start epoch, "kind": "http", "method", "endpoint", "status",
+     "req_bytes", "resp_bytes", "ms", "ttfb_ms", "body": shape, "query": shape}
+    {"t": start epoch, "kind": "ws", "endpoint", "query": shape, "ms",
+     "events": [[offset_ms, "in"|"out", kind, bytes, fields?], ...]}
+
+Shapes keep numbers and a few enum-like fields (output_format, language,
+...), replace strings by {"s": length} and user ids by salted pseudonyms.
+"""
+import os
+import re
+import json
+import time
+import queue
+import atexit
+import hashlib
+import logging
+import logging.handlers
+from typing import Any, Optional
+from urllib.parse import parse_qsl
+
+from logging_setup import NonBlockingQueueHandler
+
+logger = logging.getLogger(__name__)
+
+# Endpoints worth replaying
+RECORDED_PREFIXES = ("/api/chat", "/api/mood/analyze", "/api/voice/", "/ws/voice-call")
+
+# Fields recorded verbatim: enum-like options, never free text
+VERBATIM_FIELDS = {"type", "output_format", "voice", "language", "speculative", "mood_rating"}
+
+# Fields replaced by a pseudonym so per-user load shape survives
+PSEUDONYM_FIELDS = {"user_id"}
+
+# Only this much of a JSON body is inspected for its shape
+MAX_SHAPE_BODY_BYTES = 64 * 1024
+
+# Job ids and similar path parameters
+PATH_ID = re.compile(r"/[0-9a-f]{16,}(?=/|$)")
+
+# Message type of an outgoing JSON message, read from its first bytes
+MESSAGE_TYPE = re.compile(r'"type":\s*"(\w+)"')
+
+
+def normalize_endpoint(path: str) -> str:
+    """Replace ids in a path so requests group per endpoint"""
+    return PATH_ID.sub("/{id}", path)
+
+
+def is_recorded(path: str) -> bool:
+    return path.startswith(RECORDED_PREFIXES)
+
+
+class TrafficRecorder:
+    """Writes anonymized traffic entries to a rotating log"""
+    
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        max_bytes: int = 50 * 1024 * 1024,
+        backup_count: int = 5,
+        salt: Optional[str] = None
+    ):
+        """
+        Initialize traffic recorder
+        
+        Args:
+            path: Log file (None disables recording)
+            max_bytes: Rotate the log at this size
+            backup_count: Rotated files kept (path.1 ... path.N)
+            salt: Pseudonym salt; random per process if not set, so ids
+                  cannot be linked across restarts
+        """
+        self.path = path
+        self.enabled = bool(path)
+        self._salt = (salt or os.urandom(16).hex()).encode("utf-8")
+        self.entries = 0
+        
+        self._log = logging.getLogger("traffic_recorder.log")
+        self._log.propagate = False
+        self._log.setLevel(logging.INFO)
+        
+        if self.enabled:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            handler = logging.handlers.RotatingFileHandler(
+                path,
+                maxBytes=max_bytes,
+                backupCount=backup_count,
+                encoding="utf-8"
+            )
+            handler.setFormatter(logging.Formatter("%(message)s"))
+            
+            # File writes happen on a background thread, off the request path
+            log_queue = queue.Queue(maxsize=10000)
+            self._log.addHandler(NonBlockingQueueHandler(log_queue))
+            listener = logging.handlers.QueueListener(log_queue, handler)
+            listener.start()
+            atexit.register(listener.stop)
+            logger.info(f"Recording traffic to {path}")
+    
+    def pseudonym(self, value: Any) -> str:
+        """Stable, salted stand-in for a user id"""
+        digest = hashlib.blake2b(str(value).encode("utf-8"), key=self._salt, digest_size=6)
+        return f"u-{digest.hexdigest()}"
+    
+    def shape(self, value: Any, key: Optional[str] = None) -> Any:
+        """
+        Describe a JSON value without its text
+        
+        Args:
+            value: Parsed JSON value
+            key: Field name the value belongs to
+        
+        Returns:
+            Anonymized value with the same structure and sizes
+        """
+        if key in PSEUDONYM_FIELDS and value is not None:
+            return self.pseudonym(value)
+        if isinstance(value, dict):
+            return {k: self.shape(v, k) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.shape(v) for v in value]
+        if isinstance(value, str):
+            return value if key in VERBATIM_FIELDS else {"s": len(value)}
+        return value
+    
+    def shape_query(self, query_string: bytes) -> Optional[dict]:
+        if not query_string:
+            return None
+        return self.shape(dict(parse_qsl(query_string.decode("latin-1"))))
+    
+    def write(self, entry: dict):
+        """Append one entry"""
+        self.entries += 1
+        self._log.info(json.dumps(entry, separators=(",", ":")))
+
+
+class TrafficRecorderMiddleware:
+    """
+    ASGI middleware recording HTTP requests and WebSocket sessions
+    Bodies are counted as they stream through, never buffered
+    """
+    
+    def __init__(self, app, recorder: Optional[TrafficRecorder] = None):
+        self.app = app
+        self.recorder = recorder or get_traffic_recorder()
+    
+    async def __call__(self, scope, receive, send):
+        if not self.recorder.enabled or scope["type"] not in ("http", "websocket") or not is_recorded(scope["path"]):
+            await self.app(scope, receive, send)
+        elif scope["type"] == "http":
+            await self._record_http(scope, receive, send)
+        else:
+            await self._record_websocket(scope, receive, send)
+    
+    async def _record_http(self, scope, receive, send):
+        started = time.perf_counter()
+        entry = {
+            "t": round(time.time(), 3),
+            "kind": "http",
+            "method": scope["method"],
+            "endpoint": normalize_endpoint(scope["path"]),
+            "status": None,
+            "req_bytes": 0,
+            "resp_bytes": 0
+        }
+        
+        content_type = dict(scope["headers"]).get(b"content-type", b"")
+        is_json = content_type.startswith(b"application/json")
+        if content_type.startswith(b"multipart/"):
+            entry["upload"] = "multipart"
+        body = bytearray()
+        first_byte_at = None
+        
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                entry["req_bytes"] += len(chunk)
+                if is_json and len(body) < MAX_SHAPE_BODY_BYTES:
+                    body.extend(chunk)
+            return message
+        
+        async def send_wrapper(message):
+            nonlocal first_byte_at
+            if message["type"] == "http.response.start":
+                entry["status"] = message["status"]
+            elif message["type"] == "http.response.body":
+                entry["resp_bytes"] += len(message.get("body", b""))
+                if first_byte_at is None:
+                    first_byte_at = time.perf_counter()
+            await send(message)
+        
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            finished = time.perf_counter()
+            entry["ms"] = round((finished - started) * 1000, 1)
+            entry["ttfb_ms"] = round(((first_byte_at or finished) - started) * 1000, 1)
+            
+            query = self.recorder.shape_query(scope.get("query_string", b""))
+            if query:
+                entry["query"] = query
+            if body:
+                try:
+                    entry["body"] = self.recorder.shape(json.loads(body))
+                except ValueError:
+                    pass
+            
+            self.recorder.write(entry)
+    
+    async def _record_websocket(self, scope, receive, send):
+        started = time.perf_counter()
+        events = []
+        entry = {
+            "t": round(time.time(), 3),
+            "kind": "ws",
+            "endpoint": normalize_endpoint(scope["path"]),
+            "events": events
+        }
+        
+        query = self.recorder.shape_query(scope.get("query_string", b""))
+        if query:
+            entry["query"] = query
+        
+        def offset_ms() -> int:
+            return int((time.perf_counter() - started) * 1000)
+        
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "websocket.receive":
+                if message.get("bytes") is not None:
+                    events.append([offset_ms(), "in", "bytes", len(message["bytes"])])
+                elif message.get("text") is not None:
+                    text = message["text"]
+                    try:
+                        control = json.loads(text)
+                        fields = {
+                            k: v for k, v in self.recorder.shape(control).items()
+                            if k != "type"
+                        }
+                        kind = str(control.get("type"))
+                    except (ValueError, AttributeError):
+                        fields, kind = {}, "text"
+                    event = [offset_ms(), "in", kind, len(text)]
+                    if fields:
+                        event.append(fields)
+                    events.append(event)
+            return message
+        
+        async def send_wrapper(message):
+            if message["type"] == "websocket.send":
+                if message.get("bytes") is not None:
+                    events.append([offset_ms(), "out", "bytes", len(message["bytes"])])
+                elif message.get("text") is not None:
+                    # Replies carry base64 audio: only look at the start
+                    match = MESSAGE_TYPE.search(message["text"][:100])
+                    kind = match.group(1) if match else "text"
+                    events.append([offset_ms(), "out", kind, len(message["text"])])
+            await send(message)
+        
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            entry["ms"] = offset_ms()
+            self.recorder.write(entry)
+
+
+# Global instance (singleton)
+traffic_recorder: Optional[TrafficRecorder] = None
+
+
+def get_traffic_recorder() -> TrafficRecorder:
+    """Get or create traffic recorder instance"""
+    global traffic_recorder
+    
+    if traffic_recorder is None:
+        path = os.getenv("TRAFFIC_RECORD_PATH") or None
+        max_bytes = int(os.getenv("TRAFFIC_RECORD_MAX_BYTES", str(50 * 1024 * 1024)))
+        backup_count = int(os.getenv("TRAFFIC_RECORD_BACKUPS", "5"))
+        salt = os.getenv("TRAFFIC_RECORD_SALT") or None
+        
+        traffic_recorder = TrafficRecorder(
+            path=path,
+            max_bytes=max_bytes,
+            backup_count=backup_count,
+            salt=salt
+        )
+    
+    return traffic_recorder
@@ -0,0 +1,154 @@
+"""
+Transcript cache for retried voice uploads
+Mobile clients on weak connections resend the same clip after timeouts;
+identical audio is answered from memory instead of running Whisper again
+"""
+from __future__ import annotations
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple, Union
+
+from startup_report import lazy_import
+
+np = lazy_import("numpy")
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptCache:
+    """
+    Bounded LRU cache of transcripts with a per-entry TTL
+    Keys are audio fingerprints combined with language and model settings
+    """
+    
+    def __init__(self, max_entries: int = 512, ttl_seconds: float = 600.0):
+        """
+        Initialize transcript cache
+        
+        Args:
+            max_entries: Maximum number of cached transcripts (0 disables)
+            ttl_seconds: Time-to-live of each entry in seconds
+        """
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[str, Tuple[float, Tuple[str, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        
+        logger.info(f"TranscriptCache configured: max_entries={max_entries}, ttl={ttl_seconds}s")
+    
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+    
+    @staticmethod
+    def fingerprint(audio: Union[bytes, np.ndarray]) -> str:
+        """
+        Hash uploaded bytes or decoded PCM samples
+        
+        Args:
+            audio: Encoded audio bytes or a samples array
+        
+        Returns:
+            Hex digest identifying the audio content
+        """
+        if isinstance(audio, np.ndarray):
+            audio = np.ascontiguousarray(audio)
+        return hashlib.blake2b(audio, digest_size=16).hexdigest()
+    
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        """
+        Look up a transcript
+        
+        Args:
+            key: Cache key
+        
+        Returns:
+            Tuple of (transcript, confidence), or None on miss
+        """
+        if not self.enabled:
+            return None
+        
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            stored_at, value = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: str, transcript: str, confidence: float):
+        """
+        Store a transcript, evicting the least recently used entry if full
+        
+        Args:
+            key: Cache key
+            transcript: Transcribed text
+            confidence: Transcription confidence
+        """
+        if not self.enabled:
+            return
+        
+        with self._lock:
+            self._entries[key] = (time.monotonic(), (transcript, confidence))
+            self._entries.move_to_end(key)
+            
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def clear(self):
+        """Remove all entries"""
+        with self._lock:
+            self._entries.clear()
+    
+    def get_stats(self) -> dict:
+        """Get cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0
+        }
+
+
+# Global instance (singleton)
+transcript_cache: Optional[TranscriptCache] = None
+
+
+def get_transcript_cache() -> TranscriptCache:
+    """Get or create transcript cache instance"""
+    global transcript_cache
+    
+    if transcript_cache is None:
+        max_entries = int(os.getenv("TRANSCRIPT_CACHE_SIZE", "512"))
+        ttl_seconds = float(os.getenv("TRANSCRIPT_CACHE_TTL_SECONDS", "600"))
+        
+        transcript_cache = TranscriptCache(
+            max_entries=max_entries,
+            ttl_seconds=ttl_seconds
+        )
+    
+    return transcript_cache
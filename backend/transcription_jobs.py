@@ -0,0 +1,278 @@
+"""
+Background transcription jobs for long recordings
+Long audio is split at VAD silence boundaries and the chunks are
+transcribed in parallel, then stitched back in order with timestamps
+"""
+from __future__ import annotations
+import os
+import time
+import uuid
+import asyncio
+import logging
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+from startup_report import lazy_import
+from logging_setup import sampled
+from whisper_service import WhisperService, get_whisper_service
+from audio_utils import AudioUtils
+
+np = lazy_import("numpy")
+vad = lazy_import("faster_whisper.vad", "faster_whisper")
+
+logger = logging.getLogger(__name__)
+
+
+class TranscriptionJob:
+    """State and progress of one background transcription"""
+    
+    def __init__(self, duration_seconds: float, language: Optional[str] = None):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"  # queued, running, completed, failed
+        self.language = language
+        self.duration_seconds = duration_seconds
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.chunks_total = 0
+        self.chunks_done = 0
+        self.segments: List[dict] = []
+        self.transcript = ""
+        self.confidence = 0.0
+        self.error: Optional[str] = None
+        self._changed = asyncio.Event()
+    
+    @property
+    def is_finished(self) -> bool:
+        return self.status in ("completed", "failed")
+    
+    def notify(self):
+        """Record an update and wake up watchers"""
+        self.updated_at = time.time()
+        self._changed.set()
+        self._changed = asyncio.Event()
+    
+    async def watch(self) -> AsyncIterator[dict]:
+        """
+        Yield a snapshot now and after every update until the job finishes
+        """
+        while True:
+            # Grab the event before yielding so no update is missed
+            changed = self._changed
+            yield self.to_dict()
+            if self.is_finished:
+                return
+            await changed.wait()
+    
+    def to_dict(self) -> dict:
+        progress = self.chunks_done / self.chunks_total if self.chunks_total else 0.0
+        result = {
+            "job_id": self.id,
+            "status": self.status,
+            "progress": progress,
+            "chunks_total": self.chunks_total,
+            "chunks_done": self.chunks_done,
+            "duration_seconds": self.duration_seconds,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
+        }
+        
+        if self.status == "completed":
+            result.update({
+                "transcript": self.transcript,
+                "confidence": self.confidence,
+                "segments": self.segments
+            })
+        
+        if self.error:
+            result["error"] = self.error
+        
+        return result
+
+
+class TranscriptionJobManager:
+    """
+    Runs transcription jobs in the background
+    Leaves at least one Whisper worker free for interactive requests
+    """
+    
+    def __init__(
+        self,
+        whisper_service: WhisperService,
+        max_chunk_seconds: float = 30.0,
+        max_parallel_chunks: Optional[int] = None,
+        max_active_jobs: int = 4,
+        job_ttl_seconds: float = 3600.0
+    ):
+        """
+        Initialize job manager
+        
+        Args:
+            whisper_service: Whisper service used for transcription
+            max_chunk_seconds: Maximum length of one transcribed chunk
+            max_parallel_chunks: Chunks transcribed at once across all jobs
+                                 (default: Whisper workers minus one)
+            max_active_jobs: Maximum queued or running jobs
+            job_ttl_seconds: How long finished jobs stay available
+        """
+        self.whisper_service = whisper_service
+        self.max_chunk_seconds = max_chunk_seconds
+        self.max_parallel_chunks = max_parallel_chunks or max(1, whisper_service.num_workers - 1)
+        self.max_active_jobs = max_active_jobs
+        self.job_ttl_seconds = job_ttl_seconds
+        
+        self._jobs: Dict[str, TranscriptionJob] = {}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._chunk_slots = asyncio.Semaphore(self.max_parallel_chunks)
+        
+        logger.info(
+            f"TranscriptionJobManager configured: max_chunk={max_chunk_seconds}s, "
+            f"parallel_chunks={self.max_parallel_chunks}"
+        )
+    
+    def active_jobs(self) -> int:
+        """Number of queued or running jobs"""
+        return sum(1 for job in self._jobs.values() if not job.is_finished)
+    
+    def get(self, job_id: str) -> Optional[TranscriptionJob]:
+        """Get a job by id"""
+        return self._jobs.get(job_id)
+    
+    def submit(self, samples: np.ndarray, language: Optional[str] = None) -> TranscriptionJob:
+        """
+        Start transcribing decoded audio in the background
+        
+        Args:
+            samples: 16kHz mono float32 samples
+            language: Override language (optional)
+        
+        Returns:
+            The created job
+        """
+        self._purge_expired()
+        
+        job = TranscriptionJob(
+            duration_seconds=len(samples) / AudioUtils.TARGET_SAMPLE_RATE,
+            language=language
+        )
+        self._jobs[job.id] = job
+        self._tasks[job.id] = asyncio.create_task(self._run(job, samples))
+        
+        logger.info("Transcription job %s submitted (%.1fs)", job.id, job.duration_seconds, extra=sampled())
+        return job
+    
+    def plan_chunks(self, samples: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Split audio into chunks at silence boundaries
+        
+        Speech regions found by Silero VAD are grouped greedily until the
+        next region would exceed max_chunk_seconds; cuts therefore fall
+        inside pauses, never in the middle of a word.
+        
+        Args:
+            samples: 16kHz mono float32 samples
+        
+        Returns:
+            List of (start_sample, end_sample) tuples in order
+        """
+        sr = AudioUtils.TARGET_SAMPLE_RATE
+        max_len = int(self.max_chunk_seconds * sr)
+        
+        speech = vad.get_speech_timestamps(
+            samples,
+            vad.VadOptions(
+                min_silence_duration_ms=500,
+                max_speech_duration_s=self.max_chunk_seconds,
+                speech_pad_ms=200
+            )
+        )
+        
+        chunks: List[Tuple[int, int]] = []
+        for region in speech:
+            start, end = region["start"], region["end"]
+            if chunks and end - chunks[-1][0] <= max_len:
+                chunks[-1] = (chunks[-1][0], end)
+            else:
+                chunks.append((start, end))
+        
+        return chunks
+    
+    async def _run(self, job: TranscriptionJob, samples: np.ndarray):
+        """Transcribe all chunks of a job and stitch the results"""
+        try:
+            job.status = "running"
+            chunks = await asyncio.to_thread(self.plan_chunks, samples)
+            job.chunks_total = len(chunks)
+            job.notify()
+            
+            sr = AudioUtils.TARGET_SAMPLE_RATE
+            results = await asyncio.gather(*[
+                self._transcribe_chunk(job, samples[start:end], start / sr)
+                for start, end in chunks
+            ])
+            
+            # gather keeps chunk order, so segments stay in time order
+            job.segments = [segment for chunk in results for segment in chunk]
+            job.transcript = " ".join(s["text"] for s in job.segments if s["text"]).strip()
+            job.confidence = (
+                float(np.mean([s["confidence"] for s in job.segments])) if job.segments else 0.0
+            )
+            job.status = "completed"
+            logger.info("Transcription job %s completed: %d chunks", job.id, len(chunks), extra=sampled())
+        
+        except Exception as e:
+            logger.error(f"Transcription job {job.id} failed: {e}")
+            job.status = "failed"
+            job.error = str(e)
+        
+        finally:
+            self._tasks.pop(job.id, None)
+            job.notify()
+    
+    async def _transcribe_chunk(
+        self,
+        job: TranscriptionJob,
+        samples: np.ndarray,
+        offset_seconds: float
+    ) -> List[dict]:
+        async with self._chunk_slots:
+            segments = await self.whisper_service.transcribe_segments(
+                samples,
+                language=job.language,
+                offset_seconds=offset_seconds
+            )
+        
+        job.chunks_done += 1
+        job.notify()
+        return segments
+    
+    def _purge_expired(self):
+        """Forget finished jobs older than the TTL"""
+        now = time.time()
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.is_finished and now - job.updated_at > self.job_ttl_seconds
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+
+# Global instance (singleton)
+transcription_job_manager: Optional[TranscriptionJobManager] = None
+
+
+def get_transcription_job_manager() -> TranscriptionJobManager:
+    """Get or create transcription job manager instance"""
+    global transcription_job_manager
+    
+    if transcription_job_manager is None:
+        max_chunk_seconds = float(os.getenv("TRANSCRIPTION_JOB_CHUNK_SECONDS", "30"))
+        max_active_jobs = int(os.getenv("TRANSCRIPTION_JOB_MAX_ACTIVE", "4"))
+        job_ttl_seconds = float(os.getenv("TRANSCRIPTION_JOB_TTL_SECONDS", "3600"))
+        
+        transcription_job_manager = TranscriptionJobManager(
+            whisper_service=get_whisper_service(),
+            max_chunk_seconds=max_chunk_seconds,
+            max_active_jobs=max_active_jobs,
+            job_ttl_seconds=job_ttl_seconds
+        )
+    
+    return transcription_job_manager
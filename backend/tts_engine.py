@@ -0,0 +1,249 @@
+"""
+TTS engine layer
+Caps concurrent TTS sessions, synthesizes long replies as sentence batches
+in parallel and protects against slow sessions with timeouts and hedging
+"""
+import re
+import asyncio
+import logging
+from typing import Awaitable, Callable, List, Optional
+
+from startup_report import lazy_import
+
+httpx = lazy_import("httpx")
+
+logger = logging.getLogger(__name__)
+
+# Sentence boundary: end punctuation followed by whitespace, or a newline
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])\s+|\n+")
+
+
+class HTTPTTSBackend:
+    """
+    TTS backend that posts text to an HTTP endpoint and returns the body
+    Used to run the engine against a local (fake) TTS server
+    """
+    
+    def __init__(self, url: str, voice: Optional[str] = None):
+        """
+        Initialize HTTP backend
+        
+        Args:
+            url: Endpoint accepting POST {"text", "voice"} and returning audio
+            voice: Voice ID forwarded to the server
+        """
+        self.url = url
+        self.voice = voice
+        self._client = httpx.AsyncClient(timeout=None)
+    
+    async def __call__(self, text: str) -> bytes:
+        response = await self._client.post(self.url, json={"text": text, "voice": self.voice})
+        response.raise_for_status()
+        return response.content
+
+
+class TTSEngine:
+    """
+    Runs a TTS backend with a session limit, parallel sentence batches,
+    per-session timeouts and hedged retries
+    """
+    
+    def __init__(
+        self,
+        backend: Callable[[str], Awaitable[bytes]],
+        max_sessions: int = 4,
+        max_batch_chars: int = 200,
+        timeout_seconds: float = 15.0,
+        hedge_after_seconds: float = 3.0,
+        max_attempts: int = 2
+    ):
+        """
+        Initialize TTS engine
+        
+        Args:
+            backend: Async function synthesizing one piece of text in one session
+            max_sessions: Maximum concurrent TTS sessions (all requests)
+            max_batch_chars: Sentences are grouped into batches up to this size
+            timeout_seconds: Give up on a single session after this long
+            hedge_after_seconds: Start a duplicate session if the first one
+                                 has not finished this long after getting a
+                                 session slot, and a slot is free (0 disables)
+            max_attempts: Sessions tried per batch, including hedges and retries
+        """
+        self.backend = backend
+        self.max_sessions = max_sessions
+        self.max_batch_chars = max_batch_chars
+        self.timeout_seconds = timeout_seconds
+        self.hedge_after_seconds = hedge_after_seconds
+        self.max_attempts = max(1, max_attempts)
+        
+        self._sessions = asyncio.Semaphore(max_sessions)
+        self.active_sessions = 0
+        self.stats = {
+            "sessions": 0,
+            "batches": 0,
+            "hedges": 0,
+            "hedges_skipped": 0,
+            "retries": 0,
+            "timeouts": 0,
+            "failures": 0
+        }
+    
+    def split_batches(self, text: str) -> List[str]:
+        """
+        Split text into sentence batches of at most max_batch_chars
+        
+        A single sentence longer than the limit becomes its own batch.
+        
+        Args:
+            text: Text to split
+        
+        Returns:
+            Batches in reading order
+        """
+        sentences = [s.strip() for s in SENTENCE_BOUNDARY.split(text) if s.strip()]
+        
+        batches: List[str] = []
+        for sentence in sentences:
+            if batches and len(batches[-1]) + 1 + len(sentence) <= self.max_batch_chars:
+                batches[-1] = f"{batches[-1]} {sentence}"
+            else:
+                batches.append(sentence)
+        
+        return batches
+    
+    async def synthesize(self, text: str) -> bytes:
+        """
+        Synthesize text, batches in parallel, audio reassembled in order
+        
+        The backend must produce a concatenable stream (e.g. MP3 frames).
+        
+        Args:
+            text: Text to synthesize
+        
+        Returns:
+            Audio data as bytes
+        """
+        batches = self.split_batches(text)
+        if not batches:
+            return b""
+        
+        # gather preserves order, so the audio is joined in reading order
+        parts = await asyncio.gather(*[self._synthesize_batch(batch) for batch in batches])
+        return b"".join(parts)
+    
+    async def _synthesize_batch(self, text: str) -> bytes:
+        """Synthesize one batch, hedging slow sessions and retrying failures"""
+        self.stats["batches"] += 1
+        loop = asyncio.get_running_loop()
+        attempts: List[asyncio.Task] = []
+        launched = 0
+        last_error: Optional[BaseException] = None
+        
+        # Latest attempt: set once it holds a session slot
+        started = asyncio.Event()
+        hedge_at: Optional[float] = None
+        
+        def launch():
+            nonlocal launched, started, hedge_at
+            launched += 1
+            started = asyncio.Event()
+            hedge_at = None
+            attempts.append(asyncio.create_task(self._session(text, started)))
+        
+        try:
+            launch()
+            
+            while attempts:
+                timeout = None
+                waiter: Optional[asyncio.Task] = None
+                
+                # Hedge only while more attempts are allowed
+                if self.hedge_after_seconds > 0 and launched < self.max_attempts:
+                    if started.is_set():
+                        if hedge_at is None:
+                            hedge_at = loop.time() + self.hedge_after_seconds
+                        timeout = max(0.0, hedge_at - loop.time())
+                    else:
+                        # Time spent queued for a slot does not count
+                        waiter = asyncio.create_task(started.wait())
+                
+                try:
+                    done, _ = await asyncio.wait(
+                        attempts + ([waiter] if waiter else []),
+                        timeout=timeout,
+                        return_when=asyncio.FIRST_COMPLETED
+                    )
+                finally:
+                    if waiter is not None:
+                        waiter.cancel()
+                
+                done.discard(waiter)
+                if not done:
+                    if waiter is not None:
+                        # Attempt got its slot: the hedge clock starts now
+                        continue
+                    
+                    if self._sessions.locked():
+                        # A hedge would only queue behind other sessions
+                        self.stats["hedges_skipped"] += 1
+                        hedge_at = loop.time() + self.hedge_after_seconds
+                        continue
+                    
+                    # Slow session: race a duplicate against it
+                    self.stats["hedges"] += 1
+                    launch()
+                    continue
+                
+                for task in done:
+                    attempts.remove(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                
+                # Every running attempt failed: retry if allowed
+                if not attempts and launched < self.max_attempts:
+                    self.stats["retries"] += 1
+                    launch()
+            
+            raise last_error or RuntimeError("TTS synthesis failed")
+        
+        finally:
+            # Losing hedges (or everything, if we were cancelled) stop here
+            for task in attempts:
+                task.cancel()
+    
+    async def _session(self, text: str, started: Optional[asyncio.Event] = None) -> bytes:
+        """
+        Run one backend session under the session limit and timeout
+        
+        Args:
+            text: Text to synthesize
+            started: Set once the session holds a slot
+        """
+        async with self._sessions:
+            if started is not None:
+                started.set()
+            self.active_sessions += 1
+            self.stats["sessions"] += 1
+            try:
+                return await asyncio.wait_for(self.backend(text), timeout=self.timeout_seconds)
+            except asyncio.TimeoutError:
+                self.stats["timeouts"] += 1
+                raise
+            except Exception:
+                self.stats["failures"] += 1
+                raise
+            finally:
+                self.active_sessions -= 1
+    
+    def get_info(self) -> dict:
+        """Get engine configuration and counters"""
+        return {
+            "max_sessions": self.max_sessions,
+            "active_sessions": self.active_sessions,
+            "max_batch_chars": self.max_batch_chars,
+            "timeout_seconds": self.timeout_seconds,
+            "hedge_after_seconds": self.hedge_after_seconds,
+            **self.stats
+        }
@@ -4,10 +4,15 @@ Optimized for VPS deployment - cloud-based, no heavy models
 """
 import os
 import io
+import wave
 import logging
 from typing import Optional, List
-import edge_tts
 import asyncio
+from tts_engine import TTSEngine, HTTPTTSBackend
+from startup_report import lazy_import
+from logging_setup import sampled
+
+edge_tts = lazy_import("edge_tts")
 
 logger = logging.getLogger(__name__)
 
@@ -24,12 +29,38 @@ class TTSService:
         "male": "id-ID-ArdiNeural"      # Male, natural
     }
     
+    # Output formats clients can request
+    # Edge TTS always returns 24kHz MP3; other formats are transcoded once
+    OUTPUT_FORMATS = {
+        "mp3": {"media_type": "audio/mpeg", "extension": "mp3"},
+        "opus": {"media_type": "audio/webm", "extension": "webm"},
+        "ogg": {"media_type": "audio/ogg", "extension": "ogg"},
+        "pcm": {"media_type": "audio/L16; rate=24000; channels=1", "extension": "pcm"},
+        "wav": {"media_type": "audio/wav", "extension": "wav"}
+    }
+    
+    # Edge/Azure style format names accepted as aliases
+    FORMAT_ALIASES = {
+        "audio-24khz-48kbitrate-mono-mp3": "mp3",
+        "webm-24khz-16bit-mono-opus": "opus",
+        "ogg-24khz-16bit-mono-opus": "ogg",
+        "raw-24khz-16bit-mono-pcm": "pcm",
+        "riff-24khz-16bit-mono-pcm": "wav"
+    }
+    
+    # Sample rate of Edge TTS audio (and of pcm/wav output)
+    OUTPUT_SAMPLE_RATE = 24000
+    
     def __init__(
         self,
         voice: str = "id-ID-GadisNeural",
         rate: str = "+0%",
         volume: str = "+0%",
-        pitch: str = "+0Hz"
+        pitch: str = "+0Hz",
+        engine_options: Optional[dict] = None,
+        backend_url: Optional[str] = None,
+        default_output_format: str = "mp3",
+        opus_bitrate: str = "24k"
     ):
         """
         Initialize TTS service
@@ -39,54 +70,163 @@ class TTSService:
             rate: Speech rate (-50% to +100%)
             volume: Volume (-50% to +50%)
             pitch: Pitch adjustment
+            engine_options: TTSEngine options (session limit, batching, timeouts)
+            backend_url: Use an HTTP TTS server instead of Edge TTS (e.g. a
+                         local fake server for testing)
+            default_output_format: Format used when a request does not pick one
+            opus_bitrate: Bitrate of opus/ogg output
         """
         self.voice = voice
         self.rate = rate
         self.volume = volume
         self.pitch = pitch
+        self.backend_url = backend_url
+        self.default_output_format = self.resolve_output_format(default_output_format)
+        self.opus_bitrate = opus_bitrate
+        
+        backend = HTTPTTSBackend(backend_url, voice) if backend_url else self._edge_session
+        self.engine = TTSEngine(backend, **(engine_options or {}))
         
         logger.info(f"TTSService initialized: voice={voice}")
     
+    @classmethod
+    def resolve_output_format(cls, output_format: Optional[str]) -> str:
+        """
+        Normalize a requested output format
+        
+        Args:
+            output_format: Format name (mp3, opus, ogg, pcm, wav) or an
+                           Edge-style alias; None for mp3
+        
+        Returns:
+            Canonical format name
+        
+        Raises:
+            ValueError: If the format is not supported
+        """
+        name = (output_format or "mp3").lower()
+        name = cls.FORMAT_ALIASES.get(name, name)
+        if name not in cls.OUTPUT_FORMATS:
+            supported = ", ".join(cls.OUTPUT_FORMATS)
+            raise ValueError(f"Unsupported output format: {output_format} (supported: {supported})")
+        return name
+    
+    @classmethod
+    def format_from_accept(cls, accept: Optional[str]) -> Optional[str]:
+        """
+        Pick an output format from an HTTP Accept header
+        
+        Args:
+            accept: Accept header value
+        
+        Returns:
+            Format name, or None if no specific audio type was requested
+        """
+        if not accept:
+            return None
+        
+        for media_range in accept.split(","):
+            media_type = media_range.split(";")[0].strip().lower()
+            for name, info in cls.OUTPUT_FORMATS.items():
+                if info["media_type"].split(";")[0].lower() == media_type:
+                    return name
+        
+        return None
+    
     async def synthesize(
         self,
         text: str,
-        output_format: str = "audio-24khz-48kbitrate-mono-mp3"
+        output_format: Optional[str] = None
     ) -> bytes:
         """
         Convert text to speech
         
+        Long text is split into sentence batches that are synthesized in
+        parallel (within the engine's session limit) and joined in order.
+        
         Args:
             text: Text to synthesize
-            output_format: Audio format (mp3, wav, etc.)
+            output_format: Audio format (mp3, opus, ogg, pcm, wav);
+                           default_output_format if not given
         
         Returns:
             Audio data as bytes
         """
+        output_format = self.resolve_output_format(output_format or self.default_output_format)
+        
         try:
-            logger.info(f"Synthesizing text: '{text[:50]}...'")
+            logger.info("Synthesizing %d chars", len(text), extra=sampled(text=text))
             
-            # Create TTS communicator
-            communicate = edge_tts.Communicate(
-                text=text,
-                voice=self.voice,
-                rate=self.rate,
-                volume=self.volume,
-                pitch=self.pitch
-            )
+            audio_data = await self.engine.synthesize(text)
             
-            # Collect audio chunks
-            audio_data = b""
-            async for chunk in communicate.stream():
-                if chunk["type"] == "audio":
-                    audio_data += chunk["data"]
+            if output_format != "mp3":
+                audio_data = await self._transcode(audio_data, output_format)
             
-            logger.info(f"Synthesized {len(audio_data)} bytes of audio")
+            logger.info("Synthesized %d bytes of %s audio", len(audio_data), output_format, extra=sampled())
             return audio_data
             
         except Exception as e:
             logger.error(f"TTS synthesis failed: {e}")
             raise
     
+    async def _transcode(self, mp3_data: bytes, output_format: str) -> bytes:
+        """Convert synthesized MP3 to another output format with ffmpeg"""
+        if output_format in ("opus", "ogg"):
+            codec_args = [
+                "-c:a", "libopus", "-b:a", self.opus_bitrate,
+                "-application", "voip",
+                "-f", "webm" if output_format == "opus" else "ogg"
+            ]
+        else:
+            # pcm and wav: raw 16-bit mono; wav gets its header below
+            codec_args = ["-f", "s16le", "-acodec", "pcm_s16le"]
+        
+        process = await asyncio.create_subprocess_exec(
+            "ffmpeg", "-nostdin", "-v", "error",
+            "-f", "mp3", "-i", "pipe:0",
+            "-ac", "1", "-ar", str(self.OUTPUT_SAMPLE_RATE),
+            *codec_args, "pipe:1",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        output, stderr = await process.communicate(mp3_data)
+        
+        if process.returncode != 0:
+            raise RuntimeError(f"Audio transcoding failed: {stderr.decode(errors='ignore').strip()}")
+        
+        if output_format == "wav":
+            # Written here rather than by ffmpeg, which cannot fill in the
+            # chunk sizes when writing to a pipe
+            buffer = io.BytesIO()
+            with wave.open(buffer, "wb") as wav:
+                wav.setnchannels(1)
+                wav.setsampwidth(2)
+                wav.setframerate(self.OUTPUT_SAMPLE_RATE)
+                wav.writeframes(output)
+            output = buffer.getvalue()
+        
+        return output
+    
+    async def _edge_session(self, text: str) -> bytes:
+        """Synthesize text in a single Edge TTS WebSocket session"""
+        # Create TTS communicator
+        communicate = edge_tts.Communicate(
+            text=text,
+            voice=self.voice,
+            rate=self.rate,
+            volume=self.volume,
+            pitch=self.pitch
+        )
+        
+        # Collect audio chunks
+        audio_chunks = []
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                audio_chunks.append(chunk["data"])
+        
+        return b"".join(audio_chunks)
+    
     async def synthesize_to_file(
         self,
         text: str,
@@ -160,6 +300,10 @@ class TTSService:
             "rate": self.rate,
             "volume": self.volume,
             "pitch": self.pitch,
+            "default_output_format": self.default_output_format,
+            "output_formats": list(self.OUTPUT_FORMATS),
+            "backend": self.backend_url or "edge",
+            "engine": self.engine.get_info(),
             "available_voices": self.INDONESIAN_VOICES
         }
 
@@ -178,11 +322,23 @@ def get_tts_service() -> TTSService:
         volume = os.getenv("TTS_VOLUME", "+0%")
         pitch = os.getenv("TTS_PITCH", "+0Hz")
         
+        engine_options = {
+            "max_sessions": int(os.getenv("TTS_MAX_SESSIONS", "4")),
+            "max_batch_chars": int(os.getenv("TTS_BATCH_CHARS", "200")),
+            "timeout_seconds": float(os.getenv("TTS_TIMEOUT_SECONDS", "15")),
+            "hedge_after_seconds": float(os.getenv("TTS_HEDGE_AFTER_SECONDS", "3")),
+            "max_attempts": int(os.getenv("TTS_MAX_ATTEMPTS", "2"))
+        }
+        
         tts_service = TTSService(
             voice=voice,
             rate=rate,
             volume=volume,
-            pitch=pitch
+            pitch=pitch,
+            engine_options=engine_options,
+            backend_url=os.getenv("TTS_BACKEND_URL") or None,
+            default_output_format=os.getenv("TTS_OUTPUT_FORMAT", "mp3"),
+            opus_bitrate=os.getenv("TTS_OPUS_BITRATE", "24k")
         )
     
     return tts_service
@@ -0,0 +1,515 @@
+"""
+Voice call session over WebSocket
+Pipeline per turn: Audio → STT → LLM → TTS → Audio
+
+Protocol (client → server):
+- binary message: one complete utterance (default)
+- {"type": "audio_start"}: following binary messages are chunks of one
+  utterance, streamed while the user is still speaking
+- {"type": "audio_end"}: the streamed utterance is complete
+
+Utterances are limited to MAX_AUDIO_UPLOAD_BYTES and 5 minutes of audio;
+a streamed utterance over the limit is answered with an error and its
+remaining chunks are ignored until the next audio_start or audio_end.
+- {"type": "config", "speculative": true, "output_format": "opus"}:
+  session options; output_format is one of mp3, opus, ogg, pcm, wav
+- {"type": "stop"}: cancel the turn in progress
+
+Each turn runs as its own task. New speech, a stop message or a
+disconnect cancels the turn in progress: the pending Ollama request and
+TTS stream are closed and queued STT work is dropped.
+
+Utterances without speech (noise, taps, pocket recordings) are answered
+with {"type": "no_speech", "reason": ...} instead of running the LLM.
+
+Transcripts containing crisis phrases get a cached spoken safety response
+({"type": "safety_response"}) right away; the LLM reply follows as usual.
+
+LLM requests go through the fair-share scheduler with voice priority;
+pass ?user_id=... on the WebSocket URL so they count against that user.
+
+With speculative mode on, streamed utterances are transcribed
+incrementally. Once the partial transcript has been stable for a short
+time and the audio ends in silence, the LLM request starts early; the
+result is kept if the final transcript matches and restarted otherwise.
+"""
+import os
+import re
+import json
+import time
+import base64
+import asyncio
+import logging
+from typing import List, Optional, Tuple
+from fastapi import WebSocket, WebSocketDisconnect
+
+from audio_utils import AudioUtils
+from ollama_service import MENTAL_HEALTH_SYSTEM_PROMPT
+from llm_scheduler import LLMScheduler, PRIORITY_VOICE
+from crisis_detector import SAFETY_MESSAGE, CrisisDetector, get_crisis_detector
+from transcript_cache import TranscriptCache
+from tts_service import TTSService
+from whisper_service import WhisperService
+from logging_setup import sample_request, sampled
+
+logger = logging.getLogger(__name__)
+
+# Speculative LLM start (can be overridden per session with a config message)
+SPECULATIVE_LLM = os.getenv("VOICE_SPECULATIVE_LLM", "false").lower() == "true"
+
+# Partial transcript must stay unchanged this long before speculating
+SPECULATIVE_STABLE_SECONDS = float(os.getenv("VOICE_SPECULATIVE_STABLE_MS", "300")) / 1000
+
+# Minimum trailing silence that counts as "near the end of speech"
+SPECULATIVE_END_SILENCE_SECONDS = float(os.getenv("VOICE_SPECULATIVE_END_SILENCE_MS", "300")) / 1000
+
+# Minimum time between partial transcriptions of a streamed utterance
+PARTIAL_INTERVAL_SECONDS = float(os.getenv("VOICE_PARTIAL_INTERVAL_MS", "500")) / 1000
+
+# Partials re-transcribe the whole utterance so far: stop past this length
+PARTIAL_MAX_SECONDS = float(os.getenv("VOICE_PARTIAL_MAX_SECONDS", "20"))
+
+# Session counters exposed on /metrics
+voice_call_stats = {
+    "turns": 0,
+    "speculative_started": 0,
+    "speculative_hits": 0,
+    "speculative_misses": 0,
+    "partials_skipped_busy": 0,
+    "no_speech": 0,
+    "cancelled_barge_in": 0,
+    "cancelled_stop": 0,
+    "cancelled_disconnect": 0
+}
+
+
+def get_voice_call_stats() -> dict:
+    """Get voice call counters"""
+    return dict(voice_call_stats)
+
+
+def normalize_transcript(text: str) -> str:
+    """Lowercase, drop punctuation and collapse whitespace for comparison"""
+    return " ".join(re.sub(r"[^\w\s]", " ", text.lower()).split())
+
+
+class VoiceCallSession:
+    """One connected voice call client"""
+    
+    def __init__(
+        self,
+        websocket: WebSocket,
+        whisper_service: WhisperService,
+        llm_scheduler: LLMScheduler,
+        tts_service: TTSService,
+        speculative: Optional[bool] = None,
+        output_format: Optional[str] = None,
+        user_id: Optional[str] = None,
+        crisis_detector: Optional[CrisisDetector] = None
+    ):
+        """
+        Initialize voice call session
+        
+        Args:
+            websocket: Client WebSocket (not yet accepted)
+            whisper_service: Speech-to-text service
+            llm_scheduler: Fair-share scheduler in front of the LLM
+            tts_service: Text-to-speech service
+            speculative: Enable speculative LLM start (default: env setting)
+            output_format: Reply audio format (default: TTS service default)
+            user_id: Caller, for per-user fair share and rate limits (optional)
+            crisis_detector: Crisis phrase matcher (default: shared instance)
+        """
+        self.websocket = websocket
+        self.whisper_service = whisper_service
+        self.llm_scheduler = llm_scheduler
+        self.user_id = user_id
+        self.crisis_detector = crisis_detector or get_crisis_detector()
+        self.tts_service = tts_service
+        self.speculative = SPECULATIVE_LLM if speculative is None else speculative
+        self.output_format = TTSService.resolve_output_format(
+            output_format or tts_service.default_output_format
+        )
+        
+        # Turn currently being answered
+        self._turn_task: Optional[asyncio.Task] = None
+        
+        # Streamed utterance state (None when no utterance is open)
+        self._buffer: Optional[bytearray] = None
+        self._utterance_rejected = False
+        self._partial_task: Optional[asyncio.Task] = None
+        self._partials_stopped = False
+        self._last_partial_at = 0.0
+        self._partial_text: Optional[str] = None
+        self._partial_since = 0.0
+        self._speculation: Optional[Tuple[str, asyncio.Task]] = None
+    
+    async def run(self):
+        """Serve the call until the client disconnects"""
+        await self.websocket.accept()
+        logger.info("Voice call WebSocket connected")
+        
+        try:
+            while True:
+                message = await self.websocket.receive()
+                
+                if message["type"] == "websocket.disconnect":
+                    logger.info("Client disconnected from voice call")
+                    break
+                
+                if message.get("bytes") is not None:
+                    await self._on_audio(message["bytes"])
+                elif message.get("text") is not None:
+                    await self._on_control(message["text"])
+        
+        except WebSocketDisconnect:
+            logger.info("Client disconnected from voice call")
+        except Exception as e:
+            logger.error(f"WebSocket error: {e}")
+        finally:
+            # Nobody will hear the reply anymore
+            self._cancel_turn("disconnect")
+            self._reset_utterance()
+    
+    async def _on_audio(self, data: bytes):
+        """Handle a binary message"""
+        if self._buffer is None:
+            if self._utterance_rejected:
+                return
+            if len(data) > AudioUtils.MAX_UPLOAD_BYTES:
+                await self._send_error(f"Audio too large: limit is {AudioUtils.MAX_UPLOAD_BYTES} bytes")
+                return
+            # Complete utterance in a single message
+            self._start_turn(data)
+            return
+        
+        if len(self._buffer) + len(data) > AudioUtils.MAX_UPLOAD_BYTES:
+            await self._reject_utterance(f"Audio too large: limit is {AudioUtils.MAX_UPLOAD_BYTES} bytes")
+            return
+        
+        self._buffer += data
+        self._maybe_start_partial()
+    
+    async def _on_control(self, text: str):
+        """Handle a JSON control message"""
+        try:
+            control = json.loads(text)
+            message_type = control.get("type")
+        except (ValueError, AttributeError):
+            await self._send_error("Invalid control message")
+            return
+        
+        if message_type == "config":
+            if "speculative" in control:
+                self.speculative = bool(control["speculative"])
+            if "output_format" in control:
+                try:
+                    self.output_format = TTSService.resolve_output_format(control["output_format"])
+                except ValueError as e:
+                    await self._send_error(str(e))
+                    return
+            await self.websocket.send_json({
+                "type": "config",
+                "speculative": self.speculative,
+                "output_format": self.output_format,
+                "media_type": TTSService.OUTPUT_FORMATS[self.output_format]["media_type"]
+            })
+        
+        elif message_type == "audio_start":
+            # User started speaking again: barge in on the current reply
+            self._cancel_turn("barge_in")
+            self._reset_utterance()
+            self._buffer = bytearray()
+        
+        elif message_type == "audio_end":
+            if self._buffer is None:
+                if self._utterance_rejected:
+                    # Error was already sent when the limit was hit
+                    self._reset_utterance()
+                else:
+                    await self._send_error("audio_end without audio_start")
+                return
+            data = bytes(self._buffer)
+            speculation = self._speculation
+            self._speculation = None
+            self._reset_utterance()
+            self._start_turn(data, speculation)
+        
+        elif message_type == "stop":
+            cancelled = self._cancel_turn("stop")
+            self._reset_utterance()
+            await self.websocket.send_json({"type": "stopped", "cancelled": cancelled})
+        
+        else:
+            await self._send_error(f"Unknown message type: {message_type}")
+    
+    def _start_turn(
+        self,
+        data: bytes,
+        speculation: Optional[Tuple[str, asyncio.Task]] = None
+    ):
+        """Answer an utterance in the background, replacing any running turn"""
+        self._cancel_turn("barge_in")
+        self._turn_task = asyncio.create_task(self._handle_utterance(data, speculation))
+    
+    def _cancel_turn(self, reason: str) -> bool:
+        """
+        Cancel the turn in progress
+        
+        Args:
+            reason: barge_in, stop or disconnect (counted on /metrics)
+        
+        Returns:
+            True if a running turn was cancelled
+        """
+        if self._turn_task is None or self._turn_task.done():
+            return False
+        
+        self._turn_task.cancel()
+        self._turn_task = None
+        voice_call_stats[f"cancelled_{reason}"] += 1
+        logger.info("Voice turn cancelled (%s)", reason, extra=sampled())
+        return True
+    
+    async def _handle_utterance(
+        self,
+        data: bytes,
+        speculation: Optional[Tuple[str, asyncio.Task]] = None
+    ):
+        """Run one full turn and send the voice response"""
+        sample_request()
+        logger.info("Received audio: %d bytes", len(data), extra=sampled())
+        voice_call_stats["turns"] += 1
+        
+        try:
+            # Step 1-2: Speech to text
+            transcript, confidence, no_speech_reason = await self._transcribe_final(data)
+            if no_speech_reason:
+                voice_call_stats["no_speech"] += 1
+                logger.info("No speech in utterance (%s)", no_speech_reason, extra=sampled())
+                await self.websocket.send_json({"type": "no_speech", "reason": no_speech_reason})
+                return
+            
+            logger.info(
+                "Transcribed %d chars (confidence: %.2f)", len(transcript), confidence,
+                extra=sampled(transcript=transcript)
+            )
+            
+            # Crisis fast path: safety response first, full reply after
+            crisis = bool(self.crisis_detector.detect(transcript))
+            if crisis:
+                logger.warning("Crisis phrases detected in voice turn, sending safety response")
+                await self._send_safety_response(transcript, confidence)
+            
+            # Step 3: Get AI response from Ollama, reusing a matching speculation
+            llm_response = await self._resolve_llm(transcript, speculation)
+            ai_text = llm_response.get("message", {}).get("content", "Maaf, saya tidak mengerti.")
+            logger.info("AI response: %d chars", len(ai_text), extra=sampled(reply=ai_text))
+            
+            # Step 4: Convert AI response to speech (TTS)
+            audio_response = await self.tts_service.synthesize(ai_text, self.output_format)
+            audio_base64 = base64.b64encode(audio_response).decode('utf-8')
+            
+            # Step 5: Send response back to client
+            await self.websocket.send_json({
+                "type": "voice_response",
+                "transcript": transcript,
+                "ai_response": ai_text,
+                "audio_base64": audio_base64,
+                "audio_format": self.output_format,
+                "confidence": confidence,
+                "crisis": crisis
+            })
+            logger.info("Voice response sent", extra=sampled())
+        
+        except Exception as e:
+            logger.error(f"Voice pipeline error: {e}")
+            await self._send_error(f"Processing error: {str(e)}")
+        
+        finally:
+            # Cancelled before the LLM step: drop the speculative request too
+            if speculation is not None:
+                speculation[1].cancel()
+    
+    async def _send_safety_response(self, transcript: str, confidence: float):
+        """Send the cached spoken safety response"""
+        audio = await self.crisis_detector.safety_audio(self.tts_service, self.output_format)
+        await self.websocket.send_json({
+            "type": "safety_response",
+            "transcript": transcript,
+            "ai_response": SAFETY_MESSAGE,
+            "audio_base64": base64.b64encode(audio).decode("utf-8") if audio else "",
+            "audio_format": self.output_format,
+            "confidence": confidence,
+            "crisis": True
+        })
+    
+    async def _transcribe_final(self, data: bytes) -> Tuple[str, float, Optional[str]]:
+        """
+        Transcribe a complete utterance, answering resent clips from cache
+        
+        Returns:
+            Tuple of (transcript, confidence, no_speech_reason); the reason is
+            set when there is nothing to answer
+        """
+        cache_key = self.whisper_service.cache_key(TranscriptCache.fingerprint(data))
+        cached = self.whisper_service.get_cached_transcript(cache_key)
+        if cached is None:
+            samples = await asyncio.to_thread(
+                AudioUtils.load_pcm,
+                data,
+                max_duration=AudioUtils.MAX_DURATION_SECONDS + 1
+            )
+            if len(samples) > AudioUtils.MAX_DURATION_SECONDS * AudioUtils.TARGET_SAMPLE_RATE:
+                raise ValueError(f"Audio too long: limit is {AudioUtils.MAX_DURATION_SECONDS}s")
+            
+            has_speech, reason = await asyncio.to_thread(AudioUtils.detect_speech, samples)
+            if not has_speech:
+                return "", 0.0, reason
+            
+            cached = await self.whisper_service.transcribe_audio(samples, cache_key=cache_key)
+        
+        transcript, confidence = cached
+        return transcript, confidence, None if transcript.strip() else "empty_transcript"
+    
+    async def _resolve_llm(
+        self,
+        transcript: str,
+        speculation: Optional[Tuple[str, asyncio.Task]]
+    ) -> dict:
+        """Use the speculative LLM result if it was started on the same text"""
+        if speculation is not None:
+            speculative_text, task = speculation
+            if speculative_text == normalize_transcript(transcript):
+                voice_call_stats["speculative_hits"] += 1
+                return await task
+            
+            task.cancel()
+            voice_call_stats["speculative_misses"] += 1
+            logger.info("Final transcript changed, restarting LLM request", extra=sampled())
+        
+        return await self._chat(transcript)
+    
+    async def _chat(self, transcript: str) -> dict:
+        """Ask the LLM with voice priority"""
+        return await self.llm_scheduler.chat(
+            self._build_messages(transcript),
+            user_id=self.user_id,
+            priority=PRIORITY_VOICE
+        )
+    
+    @staticmethod
+    def _build_messages(transcript: str) -> List[dict]:
+        return [
+            {"role": "system", "content": MENTAL_HEALTH_SYSTEM_PROMPT},
+            {"role": "user", "content": transcript}
+        ]
+    
+    def _maybe_start_partial(self):
+        """Transcribe the audio received so far, throttled"""
+        if not self.speculative or self._partials_stopped:
+            return
+        if self._partial_task is not None and not self._partial_task.done():
+            return
+        
+        now = time.monotonic()
+        if now - self._last_partial_at < PARTIAL_INTERVAL_SECONDS:
+            return
+        
+        self._last_partial_at = now
+        if self.whisper_service.is_busy:
+            # Final transcriptions (this or other calls) go first
+            voice_call_stats["partials_skipped_busy"] += 1
+            return
+        
+        self._partial_task = asyncio.create_task(self._run_partial(bytes(self._buffer)))
+    
+    async def _run_partial(self, data: bytes):
+        """Update the partial transcript and speculate once it is stable"""
+        try:
+            # Streamed containers may end mid-frame; skip until decodable
+            samples = await asyncio.to_thread(
+                AudioUtils.load_pcm,
+                data,
+                max_duration=AudioUtils.MAX_DURATION_SECONDS + 1
+            )
+        except ValueError:
+            return
+        
+        if len(samples) > AudioUtils.MAX_DURATION_SECONDS * AudioUtils.TARGET_SAMPLE_RATE:
+            # Detach first: rejecting the utterance cancels the partial task
+            self._partial_task = None
+            await self._reject_utterance(f"Audio too long: limit is {AudioUtils.MAX_DURATION_SECONDS}s")
+            return
+        
+        if len(samples) < AudioUtils.TARGET_SAMPLE_RATE // 2:
+            return
+        
+        if len(samples) > PARTIAL_MAX_SECONDS * AudioUtils.TARGET_SAMPLE_RATE:
+            # Long utterance: wait for the final transcript
+            self._partials_stopped = True
+            return
+        
+        has_speech, _ = await asyncio.to_thread(AudioUtils.detect_speech, samples)
+        if not has_speech:
+            return
+        
+        try:
+            transcript, _ = await self.whisper_service.transcribe_audio(samples)
+        except Exception as e:
+            logger.warning(f"Partial transcription failed: {e}")
+            return
+        
+        text = normalize_transcript(transcript)
+        now = time.monotonic()
+        
+        if text != self._partial_text:
+            self._partial_text = text
+            self._partial_since = now
+            
+            # User kept talking: the running speculation is now stale
+            if self._speculation is not None and self._speculation[0] != text:
+                self._speculation[1].cancel()
+                self._speculation = None
+                voice_call_stats["speculative_misses"] += 1
+            return
+        
+        if not text or self._speculation is not None:
+            return
+        
+        stable_for = now - self._partial_since
+        trailing_silence = AudioUtils.trailing_silence_seconds(samples)
+        
+        if stable_for >= SPECULATIVE_STABLE_SECONDS and trailing_silence >= SPECULATIVE_END_SILENCE_SECONDS:
+            task = asyncio.create_task(self._chat(transcript))
+            self._speculation = (text, task)
+            voice_call_stats["speculative_started"] += 1
+            logger.info("Speculative LLM request started", extra=sampled())
+    
+    def _reset_utterance(self):
+        """Drop streamed utterance state and cancel background work"""
+        if self._partial_task is not None:
+            self._partial_task.cancel()
+        if self._speculation is not None:
+            self._speculation[1].cancel()
+        
+        self._buffer = None
+        self._utterance_rejected = False
+        self._partial_task = None
+        self._partials_stopped = False
+        self._last_partial_at = 0.0
+        self._partial_text = None
+        self._partial_since = 0.0
+        self._speculation = None
+    
+    async def _reject_utterance(self, message: str):
+        """Drop a streamed utterance over the size or duration limit"""
+        self._reset_utterance()
+        self._utterance_rejected = True
+        await self._send_error(message)
+    
+    async def _send_error(self, message: str):
+        await self.websocket.send_json({
+            "type": "error",
+            "message": message
+        })
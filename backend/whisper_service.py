@@ -2,12 +2,20 @@
 Whisper Speech-to-Text Service
 Optimized for CPU deployment on VPS (Contabo)
 """
+from __future__ import annotations
 import os
 import io
+import asyncio
 import logging
-from typing import Optional, Tuple
-from faster_whisper import WhisperModel
-import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple, Union
+from transcript_cache import TranscriptCache, get_transcript_cache
+from startup_report import get_startup_report, lazy_import, preload
+from logging_setup import sampled
+import stt_server
+
+np = lazy_import("numpy")
+faster_whisper = lazy_import("faster_whisper")
 
 logger = logging.getLogger(__name__)
 
@@ -16,6 +24,9 @@ class WhisperService:
     """
     Speech-to-Text service using faster-whisper
     Optimized for CPU-only environments
+    
+    In client mode (server_socket set) the model lives in a shared
+    stt_server.py process and this instance forwards requests to it.
     """
     
     def __init__(
@@ -23,7 +34,11 @@ class WhisperService:
         model_size: str = "base",
         device: str = "cpu",
         compute_type: str = "int8",
-        language: str = "id"
+        language: str = "id",
+        num_workers: int = 3,
+        cpu_threads: int = 0,
+        transcript_cache: Optional[TranscriptCache] = None,
+        server_socket: Optional[str] = None
     ):
         """
         Initialize Whisper service
@@ -34,46 +49,129 @@ class WhisperService:
             device: cpu or cuda
             compute_type: int8 (CPU optimized) or float16 (GPU)
             language: Language code (id for Indonesian)
+            num_workers: Number of transcriptions that can run in parallel
+            cpu_threads: CPU threads per worker (0 = library default)
+            transcript_cache: Cache for retried uploads (optional)
+            server_socket: Unix socket of a shared STT server; when set, no
+                           model is loaded in this process
         """
         self.model_size = model_size
         self.device = device
         self.compute_type = compute_type
         self.language = language
+        self.num_workers = max(1, num_workers)
+        self.cpu_threads = cpu_threads
+        self.transcript_cache = transcript_cache
+        self.server_socket = server_socket
         self.model = None
         self._is_initialized = False
+        self._init_lock = asyncio.Lock()
+        
+        # Transcriptions running or waiting for a worker thread
+        self.in_flight = 0
+        
+        # Inference runs in worker threads so the event loop stays responsive
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.num_workers,
+            thread_name_prefix="whisper"
+        )
         
         logger.info(f"WhisperService configured: model={model_size}, device={device}, language={language}")
     
+    @property
+    def is_busy(self) -> bool:
+        """True when new work would wait for a worker thread"""
+        return self.in_flight >= self.num_workers
+    
+    @property
+    def mode(self) -> str:
+        return "client" if self.server_socket else "local"
+    
     async def initialize(self):
-        """Load Whisper model (lazy loading)"""
+        """Load Whisper model (lazy loading; concurrent callers share one load)"""
         if self._is_initialized:
             return
         
+        async with self._init_lock:
+            if not self._is_initialized:
+                await self._initialize()
+    
+    async def _initialize(self):
+        if self.server_socket:
+            # Model is owned by the STT server; just make sure it answers
+            await self._ping_server()
+            self._is_initialized = True
+            logger.info(f"Using shared STT server at {self.server_socket}")
+            return
+        
         try:
             logger.info(f"Loading Whisper model: {self.model_size}")
-            self.model = WhisperModel(
-                self.model_size,
-                device=self.device,
-                compute_type=self.compute_type,
-                download_root=os.getenv("WHISPER_MODEL_DIR", "./models/whisper")
-            )
+            
+            # Import and load off the event loop so requests keep flowing
+            await asyncio.to_thread(preload, faster_whisper)
+            with get_startup_report().measure("whisper", "model_load"):
+                self.model = await asyncio.to_thread(
+                    faster_whisper.WhisperModel,
+                    self.model_size,
+                    device=self.device,
+                    compute_type=self.compute_type,
+                    cpu_threads=self.cpu_threads,
+                    num_workers=self.num_workers,
+                    download_root=os.getenv("WHISPER_MODEL_DIR", "./models/whisper")
+                )
             self._is_initialized = True
             logger.info("Whisper model loaded successfully")
         except Exception as e:
             logger.error(f"Failed to load Whisper model: {e}")
             raise
     
+    def cache_key(self, audio_fingerprint: str, language: Optional[str] = None) -> str:
+        """
+        Build a transcript cache key
+        
+        Args:
+            audio_fingerprint: Hash of the uploaded bytes or decoded PCM
+            language: Override language (optional)
+        
+        Returns:
+            Key combining the audio with language and model settings
+        """
+        return ":".join([
+            audio_fingerprint,
+            language or self.language,
+            self.model_size,
+            self.compute_type
+        ])
+    
+    def get_cached_transcript(self, cache_key: str) -> Optional[Tuple[str, float]]:
+        """
+        Look up a previously transcribed clip
+        
+        Args:
+            cache_key: Key from cache_key()
+        
+        Returns:
+            Tuple of (transcript, confidence), or None on miss
+        """
+        if self.transcript_cache is None:
+            return None
+        return self.transcript_cache.get(cache_key)
+    
     async def transcribe_audio(
         self,
-        audio_data: bytes,
-        language: Optional[str] = None
+        audio_data: Union[bytes, str, np.ndarray],
+        language: Optional[str] = None,
+        cache_key: Optional[str] = None
     ) -> Tuple[str, float]:
         """
         Transcribe audio to text
         
         Args:
-            audio_data: Audio file bytes (wav, mp3, ogg, webm)
+            audio_data: Audio file bytes (wav, mp3, ogg, webm), a file path,
+                        or decoded 16kHz mono float32 samples
             language: Override language (optional)
+            cache_key: Store the result under this transcript cache key
+                       (look it up first with get_cached_transcript)
         
         Returns:
             Tuple of (transcript, confidence)
@@ -82,37 +180,20 @@ class WhisperService:
             await self.initialize()
         
         try:
-            # Save audio to temporary buffer
-            audio_buffer = io.BytesIO(audio_data)
-            
-            # Transcribe
-            segments, info = self.model.transcribe(
-                audio_buffer,
-                language=language or self.language,
-                beam_size=5,  # Balance between speed and quality
-                vad_filter=True,  # Voice Activity Detection
-                vad_parameters=dict(
-                    min_silence_duration_ms=500  # Reduce silence processing
-                )
+            segments, avg_confidence = await self.run_transcription(
+                audio_data,
+                language or self.language
             )
             
-            # Combine segments
-            transcript = ""
-            total_confidence = 0.0
-            segment_count = 0
+            transcript = " ".join(segment["text"] for segment in segments).strip()
             
-            for segment in segments:
-                transcript += segment.text + " "
-                # avg_logprob is the confidence (-inf to 0, closer to 0 is better)
-                # Convert to 0-1 scale
-                confidence = np.exp(segment.avg_logprob)
-                total_confidence += confidence
-                segment_count += 1
-            
-            transcript = transcript.strip()
-            avg_confidence = total_confidence / segment_count if segment_count > 0 else 0.0
+            logger.info(
+                "Transcribed %d chars (confidence: %.2f)", len(transcript), avg_confidence,
+                extra=sampled(transcript=transcript)
+            )
             
-            logger.info(f"Transcribed: '{transcript[:50]}...' (confidence: {avg_confidence:.2f})")
+            if cache_key and self.transcript_cache is not None:
+                self.transcript_cache.put(cache_key, transcript, avg_confidence)
             
             return transcript, avg_confidence
             
@@ -120,6 +201,145 @@ class WhisperService:
             logger.error(f"Transcription failed: {e}")
             raise
     
+    async def transcribe_segments(
+        self,
+        samples: np.ndarray,
+        language: Optional[str] = None,
+        offset_seconds: float = 0.0
+    ) -> List[dict]:
+        """
+        Transcribe a chunk of a longer recording, keeping timestamps
+        
+        Args:
+            samples: 16kHz mono float32 samples of the chunk
+            language: Override language (optional)
+            offset_seconds: Start of the chunk within the full recording
+        
+        Returns:
+            List of segment dicts (start, end, text, confidence) with
+            timestamps relative to the full recording
+        """
+        if not self._is_initialized:
+            await self.initialize()
+        
+        segments, _ = await self.run_transcription(samples, language or self.language)
+        
+        for segment in segments:
+            segment["start"] += offset_seconds
+            segment["end"] += offset_seconds
+        
+        return segments
+    
+    async def run_transcription(self, audio_input, language: str) -> Tuple[List[dict], float]:
+        """
+        Transcribe locally in a worker thread, or on the shared STT server
+        
+        Args:
+            audio_input: Encoded bytes, file-like object, file path or
+                         16kHz mono float32 samples
+            language: Language code
+        
+        Returns:
+            Tuple of (segments, average confidence)
+        """
+        self.in_flight += 1
+        try:
+            if self.server_socket:
+                return await self._transcribe_remote(audio_input, language)
+            
+            # Paths, file objects and decoded arrays are passed through without copying
+            if isinstance(audio_input, bytes):
+                audio_input = io.BytesIO(audio_input)
+            
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                self._transcribe_sync,
+                audio_input,
+                language
+            )
+        finally:
+            self.in_flight -= 1
+    
+    async def _transcribe_remote(self, audio_input, language: str) -> Tuple[List[dict], float]:
+        """Send one transcription request to the shared STT server"""
+        meta = {"language": language}
+        payload = b""
+        
+        if isinstance(audio_input, np.ndarray):
+            meta["encoding"] = stt_server.ENCODING_PCM_F32LE
+            payload = memoryview(np.ascontiguousarray(audio_input, dtype="<f4"))
+        elif isinstance(audio_input, str):
+            meta["encoding"] = stt_server.ENCODING_PATH
+            meta["path"] = os.path.abspath(audio_input)
+        elif isinstance(audio_input, io.BytesIO):
+            meta["encoding"] = stt_server.ENCODING_FILE
+            payload = audio_input.getbuffer()
+        else:
+            meta["encoding"] = stt_server.ENCODING_FILE
+            payload = audio_input
+        
+        message_type, result, _ = await self._request_server(stt_server.MSG_TRANSCRIBE, meta, payload)
+        
+        if message_type == stt_server.MSG_ERROR:
+            raise RuntimeError(f"STT server error: {result.get('error')}")
+        
+        return result["segments"], result["confidence"]
+    
+    async def _ping_server(self) -> dict:
+        """Check that the STT server is up and return its info"""
+        message_type, info, _ = await self._request_server(stt_server.MSG_PING, {})
+        if message_type != stt_server.MSG_PONG:
+            raise RuntimeError("Unexpected reply from STT server")
+        
+        # Cache keys must name the model that actually transcribes
+        self.model_size = info.get("model_size", self.model_size)
+        self.compute_type = info.get("compute_type", self.compute_type)
+        return info
+    
+    async def _request_server(self, message_type: int, meta: dict, payload=b""):
+        """Send one frame to the STT server and read the reply"""
+        reader, writer = await asyncio.open_unix_connection(
+            self.server_socket,
+            limit=stt_server.MAX_FRAME_BYTES
+        )
+        try:
+            await stt_server.write_frame(writer, message_type, meta, payload)
+            return await stt_server.read_frame(reader)
+        finally:
+            writer.close()
+    
+    def _transcribe_sync(self, audio_input, language: str) -> Tuple[List[dict], float]:
+        """Run Whisper in the calling (worker) thread"""
+        segments, info = self.model.transcribe(
+            audio_input,
+            language=language,
+            beam_size=5,  # Balance between speed and quality
+            vad_filter=True,  # Voice Activity Detection
+            vad_parameters=dict(
+                min_silence_duration_ms=500  # Reduce silence processing
+            )
+        )
+        
+        # Segments are generated lazily; decoding happens while iterating
+        results = []
+        total_confidence = 0.0
+        
+        for segment in segments:
+            # avg_logprob is the confidence (-inf to 0, closer to 0 is better)
+            # Convert to 0-1 scale
+            confidence = float(np.exp(segment.avg_logprob))
+            total_confidence += confidence
+            results.append({
+                "start": segment.start,
+                "end": segment.end,
+                "text": segment.text.strip(),
+                "confidence": confidence
+            })
+        
+        avg_confidence = total_confidence / len(results) if results else 0.0
+        return results, avg_confidence
+    
     async def transcribe_file(
         self,
         file_path: str,
@@ -146,6 +366,9 @@ class WhisperService:
     async def health_check(self) -> bool:
         """Check if service is healthy"""
         try:
+            if self.server_socket:
+                await self._ping_server()
+                return True
             if not self._is_initialized:
                 await self.initialize()
             return self.model is not None
@@ -157,11 +380,16 @@ class WhisperService:
         """Get service information"""
         return {
             "service": "Whisper STT",
+            "mode": self.mode,
+            "server_socket": self.server_socket,
             "model_size": self.model_size,
             "device": self.device,
             "compute_type": self.compute_type,
+            "num_workers": self.num_workers,
+            "in_flight": self.in_flight,
             "language": self.language,
-            "initialized": self._is_initialized
+            "initialized": self._is_initialized,
+            "transcript_cache": self.transcript_cache.get_stats() if self.transcript_cache else None
         }
 
 
@@ -169,21 +397,38 @@ class WhisperService:
 whisper_service: Optional[WhisperService] = None
 
 
-def get_whisper_service() -> WhisperService:
-    """Get or create Whisper service instance"""
+def get_whisper_service(mode: Optional[str] = None) -> WhisperService:
+    """
+    Get or create Whisper service instance
+    
+    Args:
+        mode: local (load the model here) or client (use the shared STT
+              server); defaults to WHISPER_MODE
+    """
     global whisper_service
     
     if whisper_service is None:
+        mode = mode or os.getenv("WHISPER_MODE", "local")
+        server_socket = None
+        if mode == "client":
+            server_socket = os.getenv("WHISPER_SERVER_SOCKET", stt_server.DEFAULT_SOCKET_PATH)
+        
         model_size = os.getenv("WHISPER_MODEL", "base")
         device = os.getenv("WHISPER_DEVICE", "cpu")
         compute_type = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
         language = os.getenv("WHISPER_LANGUAGE", "id")
+        num_workers = int(os.getenv("WHISPER_NUM_WORKERS", "3"))
+        cpu_threads = int(os.getenv("WHISPER_CPU_THREADS", "0"))
         
         whisper_service = WhisperService(
             model_size=model_size,
             device=device,
             compute_type=compute_type,
-            language=language
+            language=language,
+            num_workers=num_workers,
+            cpu_threads=cpu_threads,
+            transcript_cache=get_transcript_cache(),
+            server_socket=server_socket
         )
     
     return whisper_service